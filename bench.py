@@ -0,0 +1,353 @@
+"""End-to-end forwarding benchmark against local stand-ins for YouTube and Twitch.
+
+Runs the real TwitchBot and YouTubeLiveChatPoller from main.py against two
+local servers in the same event loop:
+
+  * a fake YouTube Data API (search, videos, liveChat/messages list and
+    insert) plus the Google and Twitch OAuth token endpoints, and
+  * a minimal Twitch IRC server speaking IRC over a websocket, the way
+    irc-ws.chat.twitch.tv does.
+
+Example:
+    python bench.py --users 2000 --live-fraction 0.1 --yt-rate 0.5 --twitch-rate 0.05 --duration 60
+
+Reports p50/p99 YT->Twitch and Twitch->YT latency, forwarded messages per
+second, YouTube API calls per forwarded message and process memory growth.
+Pass --twitch-msg-limit to lift the Twitch account send limit when measuring
+the bot itself rather than Twitch's pacing.
+"""
+
+import os
+import re
+import json
+import sys
+import time
+import random
+import asyncio
+import argparse
+import socket
+import tempfile
+from collections import Counter
+
+from aiohttp import web, WSMsgType, ClientSession
+
+BOT_NICK = "benchbot"
+FORWARD_COMMAND = "!fwd"
+YT_TAG = re.compile(r"yt#\d+")
+TWITCH_TAG = re.compile(r"tw#\d+")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Stats:
+    def __init__(self):
+        self.sent_at = {}  # message tag -> time it entered the source platform
+        self.yt_to_twitch = []  # latencies in seconds
+        self.twitch_to_yt = []
+        self.api_calls = Counter()
+
+    def delivered(self, tag, bucket):
+        sent = self.sent_at.pop(tag, None)
+        if sent is not None:
+            bucket.append(time.monotonic() - sent)
+
+
+class FakeYouTube:
+    """Just enough of the YouTube Data API and OAuth endpoints for main.py."""
+
+    def __init__(self, stats, live_channels, poll_interval_ms):
+        self.stats = stats
+        self.live_channels = live_channels
+        self.poll_interval_ms = poll_interval_ms
+        self.chats = {f"lc-{channel}": [] for channel in live_channels}  # live_chat_id -> messages
+        self.counter = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/youtube/v3/search", self.search)
+        app.router.add_get("/youtube/v3/videos", self.videos)
+        app.router.add_get("/youtube/v3/liveChat/messages", self.list_messages)
+        app.router.add_post("/youtube/v3/liveChat/messages", self.insert_message)
+        app.router.add_post("/token", self.token)
+        return app
+
+    async def search(self, request):
+        self.stats.api_calls["search.list"] += 1
+        channel = request.query["channelId"]
+        items = [{"id": {"videoId": f"v-{channel}"}}] if channel in self.live_channels else []
+        return web.json_response({"items": items})
+
+    async def videos(self, request):
+        self.stats.api_calls["videos.list"] += 1
+        channel = request.query["id"][len("v-"):]
+        details = {"activeLiveChatId": f"lc-{channel}"} if channel in self.live_channels else {}
+        return web.json_response({"items": [{"liveStreamingDetails": details}]})
+
+    async def list_messages(self, request):
+        self.stats.api_calls["liveChatMessages.list"] += 1
+        log = self.chats.get(request.query["liveChatId"])
+        if log is None:
+            return web.json_response({"error": {"errors": [{"reason": "liveChatNotFound"}]}}, status=404)
+        start = int(request.query.get("pageToken", 0))
+        return web.json_response({
+            "items": log[start:],
+            "nextPageToken": str(len(log)),
+            "pollingIntervalMillis": self.poll_interval_ms,
+        })
+
+    async def insert_message(self, request):
+        self.stats.api_calls["liveChatMessages.insert"] += 1
+        body = await request.json()
+        text = body["snippet"]["textMessageDetails"]["messageText"]
+        for tag in TWITCH_TAG.findall(text):
+            self.stats.delivered(tag, self.stats.twitch_to_yt)
+        return web.json_response({"snippet": {"displayMessage": text}})
+
+    async def token(self, request):
+        self.stats.api_calls["oauth.token"] += 1
+        return web.json_response({"access_token": "bench-token", "expires_in": 3600})
+
+    def post_chat_message(self, live_chat_id):
+        self.counter += 1
+        tag = f"yt#{self.counter}"
+        self.chats[live_chat_id].append({
+            "id": f"m{self.counter}",
+            "snippet": {"displayMessage": tag},
+            "authorDetails": {"displayName": "viewer"},
+        })
+        self.stats.sent_at[tag] = time.monotonic()
+
+
+class FakeTwitchIRC:
+    """Minimal Twitch IRC-over-websocket server: login, JOIN, PRIVMSG both ways."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.ws = None
+        self.joined = set()
+        self.counter = 0
+        self.ready = asyncio.Event()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/", self.handle)
+        return app
+
+    async def send(self, *lines):
+        await self.ws.send_str("".join(line + "\r\n" for line in lines))
+
+    async def handle(self, request):
+        self.ws = web.WebSocketResponse()
+        await self.ws.prepare(request)
+        async for msg in self.ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            for line in msg.data.split("\r\n"):
+                if line:
+                    await self.on_line(line)
+        return self.ws
+
+    async def on_line(self, line):
+        if line.startswith("NICK "):
+            await self.send(f":tmi.twitch.tv 001 {BOT_NICK} :Welcome, GLHF!", f":tmi.twitch.tv 376 {BOT_NICK} :>")
+            self.ready.set()
+        elif line.startswith("CAP REQ"):
+            await self.send(f":tmi.twitch.tv CAP * ACK {line.split(' ', 2)[2]}")
+        elif line.startswith("JOIN #"):
+            channel = line[len("JOIN #"):].strip()
+            self.joined.add(channel)
+            await self.send(
+                f":{BOT_NICK}!{BOT_NICK}@{BOT_NICK}.tmi.twitch.tv JOIN #{channel}",
+                f":{BOT_NICK}.tmi.twitch.tv 353 {BOT_NICK} = #{channel} :{BOT_NICK}",
+                f":{BOT_NICK}.tmi.twitch.tv 366 {BOT_NICK} #{channel} :End of /NAMES list",
+                # twitchio only caches a channel once it sees someone else in it
+                f":{channel}!{channel}@{channel}.tmi.twitch.tv JOIN #{channel}",
+            )
+        elif line.startswith("PART #"):
+            self.joined.discard(line[len("PART #"):].strip())
+        elif line.startswith("PRIVMSG #"):
+            for tag in YT_TAG.findall(line):
+                self.stats.delivered(tag, self.stats.yt_to_twitch)
+
+    async def post_chat_message(self, channel):
+        if self.ws is None or self.ws.closed or channel not in self.joined:
+            return
+        self.counter += 1
+        tag = f"tw#{self.counter}"
+        self.stats.sent_at[tag] = time.monotonic()
+        tags = (
+            f"@badge-info=;badges=;color=;display-name={channel};emotes=;id=bench-{self.counter};mod=0;"
+            f"room-id=1;subscriber=0;tmi-sent-ts={int(time.time() * 1000)};turbo=0;user-id=2;user-type="
+        )
+        await self.send(f"{tags} :{channel}!{channel}@{channel}.tmi.twitch.tv PRIVMSG #{channel} :{FORWARD_COMMAND} {tag}")
+
+
+async def generate_traffic(args, youtube, irc, yt_chats, twitch_channels, stop_at):
+    tick = 0.05
+    while time.monotonic() < stop_at:
+        for live_chat_id in yt_chats:
+            if random.random() < args.yt_rate * tick:
+                youtube.post_chat_message(live_chat_id)
+        for channel in twitch_channels:
+            if random.random() < args.twitch_rate * tick:
+                await irc.post_chat_message(channel)
+        await asyncio.sleep(tick)
+
+
+async def serve(app, port):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run(args, main, youtube, irc, stats, layout):
+    import twitchio.websocket
+
+    yt_port, irc_port = args.yt_port, args.irc_port
+    runners = [await serve(youtube.app(), yt_port), await serve(irc.app(), irc_port)]
+    twitchio.websocket.HOST = f"ws://127.0.0.1:{irc_port}/"
+
+    if args.twitch_msg_limit:
+        main.TWITCH_MSG_LIMIT = main.TWITCH_MOD_MSG_LIMIT = args.twitch_msg_limit
+    if args.twitch_join_limit:
+        main.TWITCH_JOIN_LIMIT = args.twitch_join_limit
+    bot = main.TwitchBot()
+    bot._http.nick = BOT_NICK  # skip the id.twitch.tv token validation
+    bot._http.session = ClientSession()
+    connect_task = asyncio.create_task(bot.connect())
+
+    await asyncio.wait_for(irc.ready.wait(), 30)
+    expected = {username for username, _, _ in layout}
+    join_deadline = time.monotonic() + args.join_timeout
+    while irc.joined < expected and time.monotonic() < join_deadline:
+        await asyncio.sleep(0.5)
+    print(f"Joined {len(irc.joined)}/{len(expected)} channels")
+
+    yt_chats = [f"lc-UC{i}" for username, direction, i in layout if direction == "yt_to_twitch" and f"UC{i}" in youtube.live_channels]
+    twitch_channels = [username for username, direction, i in layout if direction == "twitch_to_yt" and f"UC{i}" in youtube.live_channels]
+
+    rss_start = rss_bytes()
+    stats.api_calls.clear()
+    started = time.monotonic()
+    await generate_traffic(args, youtube, irc, yt_chats, twitch_channels, started + args.duration)
+    await asyncio.sleep(args.drain)
+    elapsed = time.monotonic() - started
+    rss_end = rss_bytes()
+
+    report(args, stats, elapsed, rss_start, rss_end)
+
+    connect_task.cancel()
+    try:
+        await bot.close()
+    except Exception:
+        pass
+    for runner in runners:
+        await runner.cleanup()
+
+
+def report(args, stats, elapsed, rss_start, rss_end):
+    forwarded = len(stats.yt_to_twitch) + len(stats.twitch_to_yt)
+    api_calls = sum(count for endpoint, count in stats.api_calls.items() if endpoint != "oauth.token")
+    print()
+    print(f"users={args.users} live_fraction={args.live_fraction} yt_rate={args.yt_rate}/s twitch_rate={args.twitch_rate}/s duration={args.duration}s")
+    for name, latencies in (("YT->Twitch", stats.yt_to_twitch), ("Twitch->YT", stats.twitch_to_yt)):
+        print(
+            f"{name:<11} delivered={len(latencies):<7} "
+            f"p50={percentile(latencies, 50) * 1000:8.1f} ms  p99={percentile(latencies, 99) * 1000:8.1f} ms"
+        )
+    print(f"undelivered  {len(stats.sent_at)}")
+    print(f"throughput   {forwarded / elapsed:.1f} msg/s")
+    print(f"api calls    {dict(stats.api_calls)}")
+    print(f"calls/msg    {api_calls / forwarded if forwarded else float('nan'):.2f}")
+    print(f"rss growth   {(rss_end - rss_start) / 1024 / 1024:+.1f} MiB (now {rss_end / 1024 / 1024:.1f} MiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--live-fraction", type=float, default=0.2, help="share of users whose channel is live")
+    parser.add_argument("--twitch-to-yt-fraction", type=float, default=0.5, help="share of users forwarding Twitch->YT")
+    parser.add_argument("--yt-rate", type=float, default=0.5, help="YouTube chat messages per second per live chat")
+    parser.add_argument("--twitch-rate", type=float, default=0.05, help="forward commands per second per Twitch channel")
+    parser.add_argument("--poll-interval-ms", type=int, default=2000, help="pollingIntervalMillis returned by the fake API")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of generated traffic")
+    parser.add_argument("--drain", type=float, default=10, help="seconds to wait for in-flight messages afterwards")
+    parser.add_argument("--join-timeout", type=float, default=120, help="seconds to wait for channel joins")
+    parser.add_argument("--twitch-msg-limit", type=int, default=0, help="override Twitch messages per 30 s (0 keeps the real limit)")
+    parser.add_argument("--twitch-join-limit", type=int, default=0, help="override Twitch JOINs per 10 s (0 keeps the real limit)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    args.yt_port, args.irc_port = free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="ytbench-")
+    os.environ.update({
+        "USERS_DB": os.path.join(workdir, "users.db"),
+        "YT_API_BASE": f"http://127.0.0.1:{args.yt_port}/youtube/v3",
+        "YT_TOKEN_URL": f"http://127.0.0.1:{args.yt_port}/token",
+        "TWITCH_TOKEN_URL": f"http://127.0.0.1:{args.yt_port}/token",
+        "TWITCH_BOT_TOKEN": "oauth:bench",
+        "TWITCH_CLIENT_ID": "bench",
+        "TWITCH_CLIENT_SECRET": "bench",
+        "YT_CLIENT_ID": "bench",
+        "YT_CLIENT_SECRET": "bench",
+        "YT_DAILY_QUOTA": str(10 ** 9),
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(workdir)  # main.py looks for users.json in the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main as bot_main
+
+    layout = []  # (twitch_username, direction, index)
+    live_channels = set()
+    now = time.time()
+    for i in range(args.users):
+        direction = "twitch_to_yt" if random.random() < args.twitch_to_yt_fraction else "yt_to_twitch"
+        username = f"chan{i}"
+        bot_main.update_user(f"user{i}", {
+            "twitch_username": username,
+            "twitch_token": "bench", "twitch_refresh": "bench", "twitch_token_expiry": now + 3600,
+            "yt_channel": f"UC{i}",
+            "yt_token": "bench", "yt_refresh": "bench", "yt_token_expiry": now + 3600,
+            "forward_command": FORWARD_COMMAND,
+            "forward_direction": direction,
+        })
+        layout.append((username, direction, i))
+        if random.random() < args.live_fraction:
+            live_channels.add(f"UC{i}")
+
+    stats = Stats()
+    youtube = FakeYouTube(stats, live_channels, args.poll_interval_ms)
+    irc = FakeTwitchIRC(stats)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)  # TwitchBot binds to the current loop at construction
+    try:
+        loop.run_until_complete(run(args, bot_main, youtube, irc, stats, layout))
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,30 @@
 import os
 import json
+import logging
+import logging.handlers
+import queue
+import sys
+import signal
+import atexit
+import bisect
+import hashlib
+import hmac
+import multiprocessing
 import uuid
+import sqlite3
 import time
+import random
 import asyncio
 import threading
+from collections import deque, defaultdict
+from urllib.parse import urlparse, parse_qs
+from xml.etree import ElementTree
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import requests
-from aiohttp import ClientSession
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
 from flask import Flask, request, redirect, render_template, make_response
+from twitchio import Channel
 from twitchio.ext import commands
 
 # === CONFIG ===
@@ -17,24 +35,311 @@ YT_CLIENT_ID = os.getenv("YT_CLIENT_ID")
 YT_CLIENT_SECRET = os.getenv("YT_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("REDIRECT_URI", "http://localhost:10000/callback")
 
-USERS_FILE = "users.json"
+USERS_FILE = "users.json"  # legacy store, migrated into USERS_DB on first start
+USERS_DB = os.getenv("USERS_DB", "users.db")
+
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "20"))  # max YouTube polls in flight at once
+DEFAULT_POLL_INTERVAL = 5  # seconds, used when YouTube gives no pollingIntervalMillis
+MIN_POLL_INTERVAL = 1  # seconds, floor for YouTube's pollingIntervalMillis
+LIVE_CACHE_TTL = int(os.getenv("LIVE_CACHE_TTL", "600"))  # seconds to trust a resolved liveChatId
+NOT_LIVE_CACHE_TTL = int(os.getenv("NOT_LIVE_CACHE_TTL", "120"))  # seconds to trust "not live"
+NOT_LIVE_MAX_TTL = int(os.getenv("NOT_LIVE_MAX_TTL", "1800"))  # cap for the "not live" backoff
+NOT_LIVE_WEBSUB_TTL = 21600  # cap for the "not live" backoff while a verified WebSub lease announces new streams
+QUIET_BACKOFF = 1.5  # poll interval growth per empty poll of a live chat
+QUIET_MAX_INTERVAL = 30  # seconds, slowest poll rate for a quiet live chat
+QUOTA_EXHAUSTED_RECHECK = 900  # seconds between polls while the daily quota is spent
+QUOTA_TOP_CHANNELS = 10  # biggest quota spenders exported on /metrics
+
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # histogram bounds, seconds
+METRICS_PUSH_INTERVAL = 15  # seconds between shard metric snapshots sent to the coordinator
+
+SHARDS = int(os.getenv("SHARDS", "1"))  # bot worker processes; 1 runs everything in this process
+SHARD_VNODES = 160  # points per shard on the consistent hash ring
+SHARD_MONITOR_INTERVAL = 5  # seconds between shard liveness checks
+SHARD_RESPAWN_DELAY = 10  # seconds a dead shard's users stay reassigned before it is restarted
+SHARD_STOP_TIMEOUT = 20  # seconds shards get to write their final checkpoint on shutdown
+
+YT_DAILY_QUOTA = int(os.getenv("YT_DAILY_QUOTA", "10000"))  # YouTube Data API units per day
+YT_QUOTA_COSTS = {
+    "search.list": 100,
+    "videos.list": 1,
+    "liveChatMessages.list": 5,
+    "liveChatMessages.insert": 50,
+}
+
+YT_INSERT_INTERVAL = 1  # seconds between inserts into one live chat
+YT_INSERT_ATTEMPTS = 5  # tries per Twitch->YT forward before giving up
+YT_RETRY_BASE = 1  # seconds, first retry delay; doubled per attempt, with jitter
+YT_RETRY_MAX = 60  # seconds, cap for the retry delay
+YT_SEND_QUEUE_SIZE = 100  # queued Twitch->YT forwards per YouTube channel
+
+SEEN_MESSAGE_WINDOW = 2000  # recent YouTube message ids remembered per chat for dedup
+CHECKPOINT_INTERVAL = 15  # seconds between writes of poller state to the database
+CHECKPOINT_SEEN_IDS = 200  # most recent message ids kept per chat in a checkpoint
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "30"))  # seconds a forwarded text counts as a duplicate
+DEDUP_CAPACITY = 100000  # fingerprints remembered across all chats
+ECHO_PREFIXES = ("[yt]", "[twitch]", "!@")  # lines the bot itself writes
+
+TOKEN_REFRESH_MARGIN = 60  # seconds before expiry at which a token is refreshed on demand
+TOKEN_REFRESH_AHEAD = 300  # seconds before expiry at which the background sweep refreshes
+TOKEN_SWEEP_INTERVAL = 30  # seconds between background refresh sweeps
+
+BREAKER_THRESHOLD = 3  # consecutive failures before an account's requests are paused
+BREAKER_BASE = 30  # seconds, first pause; doubled per further failure
+BREAKER_MAX = 3600  # seconds, cap for the pause
+
+TWITCH_MSG_LIMIT = 20  # messages per window in channels where the bot is not a moderator
+TWITCH_MOD_MSG_LIMIT = 100  # messages per window in channels where the bot is a moderator
+TWITCH_MSG_WINDOW = 30  # seconds
+TWITCH_MAX_MESSAGE = 500  # characters per Twitch chat line
+TWITCH_SEND_QUEUE_SIZE = 200  # queued lines per channel before senders wait
+TWITCH_SEND_ATTEMPTS = 6  # failed sends per line before it is dropped; waiting for a JOIN does not count
+TWITCH_SEND_RETRY = 1  # seconds before retrying a line, doubled per attempt
+TWITCH_COALESCE = os.getenv("TWITCH_COALESCE", "1") == "1"  # merge bursts of [YT] lines into one
+TWITCH_COALESCE_SEPARATOR = " | "
+TWITCH_JOIN_LIMIT = int(os.getenv("TWITCH_JOIN_LIMIT", "20"))  # JOINs per window; verified bots get 2000
+TWITCH_JOIN_WINDOW = 10  # seconds
+TWITCH_JOIN_RETRY = 5  # seconds before retrying an unconfirmed JOIN, doubled per failure
+TWITCH_JOIN_RETRY_MAX = 300  # seconds, cap for the JOIN retry backoff
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_THROTTLE_INTERVAL = 60  # seconds between repeats of the same throttled log line
+
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").rstrip("/")  # e.g. https://your-service.onrender.com; enables WebSub
+WEBSUB_HUB = os.getenv("WEBSUB_HUB", "https://pubsubhubbub.appspot.com/subscribe")
+WEBSUB_SECRET = os.getenv("WEBSUB_SECRET") or hashlib.sha256(f"websub:{YT_CLIENT_SECRET}".encode()).hexdigest()
+WEBSUB_LEASE = 864000  # seconds requested per subscription (the hub's maximum)
+WEBSUB_RENEW_MARGIN = 86400  # seconds before a lease ends at which it is renewed
+WEBSUB_RETRY = 600  # seconds before re-requesting a subscription the hub has not verified
+WEBSUB_CHECK_INTERVAL = 300  # seconds between lease checks
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))  # total pooled connections
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "50"))  # pooled connections per host
+HTTP_KEEPALIVE = 60  # seconds an idle pooled connection is kept open
+HTTP_DNS_TTL = 300  # seconds a resolved hostname is cached
+HTTP_TIMEOUT = 15  # seconds for a whole request
+
+# Overridable so bench.py can point the bot at local stand-ins.
+YT_API_BASE = os.getenv("YT_API_BASE", "https://www.googleapis.com/youtube/v3")
+YT_TOKEN_URL = os.getenv("YT_TOKEN_URL", "https://oauth2.googleapis.com/token")
+TWITCH_TOKEN_URL = os.getenv("TWITCH_TOKEN_URL", "https://id.twitch.tv/oauth2/token")
 
 app = Flask(__name__)
 
-# === USER DATA PERSISTENCE ===
+# === LOGGING ===
 
-def load_users():
-    try:
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+LOG_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; anything passed in extra= becomes a field."""
 
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if SHARD_ID is not None:
+            entry["shard"] = SHARD_ID
+        for key, value in vars(record).items():
+            if key not in LOG_RECORD_FIELDS and key != "throttle":
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+class ThrottleFilter(logging.Filter):
+    """Lets a throttled line through once per LOG_THROTTLE_INTERVAL per (message, user, channel).
+
+    Runs in the caller's thread, so dropped repeats never reach the
+    queue; the next line that gets through carries the number it stood for.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.last = {}  # key -> (time last emitted, repeats suppressed since)
+
+    def filter(self, record):
+        if not getattr(record, "throttle", False):
+            return True
+        key = (record.msg, getattr(record, "user_id", None), getattr(record, "channel", None))
+        now = time.monotonic()
+        emitted, suppressed = self.last.get(key, (0, 0))
+        if now - emitted < self.interval:
+            self.last[key] = (emitted, suppressed + 1)
+            return False
+        self.last[key] = (now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+def throttled(**fields):
+    return dict(fields, throttle=True)
+
+def setup_logging():
+    # Callers only put records on an in-memory queue; formatting and the
+    # blocking stdout write happen on the listener's thread.
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, stream)
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.setLevel(LOG_LEVEL)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+log = logging.getLogger("bridge")
+log.addFilter(ThrottleFilter(LOG_THROTTLE_INTERVAL))
+log_listener = setup_logging()
+
+# === USER DATA PERSISTENCE ===
+
+class UserStore:
+    """SQLite (WAL mode) user records, one JSON row per user so updates touch a single row.
+
+    The same database holds the poller's checkpoints, so a restart resumes
+    each chat where it left off.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def load_all(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT user_id, data FROM users").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def load(self, user_id):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, user_id, data):
+        """Merge data into the stored record in one transaction and return the merged record."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                user = json.loads(row[0]) if row else {}
+                user.update(data)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)",
+                    (user_id, json.dumps(user)),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return user
+
+    def load_checkpoints(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT key, data FROM checkpoints").fetchall())
+
+    def save_checkpoints(self, changed, removed):
+        """Write changed checkpoint rows and drop removed ones in one transaction.
+
+        `removed` maps keys to the data last written for them; a row another
+        process has rewritten since is left alone.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO checkpoints (key, data) VALUES (?, ?)", changed.items())
+                self.conn.executemany("DELETE FROM checkpoints WHERE key = ? AND data = ?", removed.items())
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def migrate_json(self, path):
+        if not os.path.exists(path):
+            return
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                return
+            try:
+                with open(path, "r") as f:
+                    legacy = json.load(f)
+            except Exception as e:
+                log.warning("Could not read %s for migration: %s", path, e)
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)",
+                    [(user_id, json.dumps(user)) for user_id, user in legacy.items()],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        os.replace(path, path + ".migrated")
+        log.info("Migrated %d users from %s to %s", len(legacy), path, USERS_DB)
+
+user_store = UserStore(USERS_DB)
 
-users = load_users()
+def load_users():
+    user_store.migrate_json(USERS_FILE)
+    return user_store.load_all()
+
+class UserState:
+    """In-memory user records that any thread can read without locking.
+
+    `users` and `twitch_index` are never changed in place: a write copies
+    them, changes the copy and swaps it in, so a reader holding either one
+    has a consistent snapshot for as long as it likes. Listeners get
+    (user_id, old, new) after each write, on the writing thread.
+    """
+
+    def __init__(self, records):
+        self.lock = threading.RLock()  # serializes writers
+        self.listeners = []
+        self.users = dict(records)
+        # lowercased twitch_username -> (user_id, forward_command, forward_direction),
+        # so event_message can reject chat lines without scanning every user.
+        self.twitch_index = {}
+        for user_id, user in records.items():
+            self.index(self.twitch_index, user_id, None, user)
+
+    @staticmethod
+    def index(twitch_index, user_id, old, new):
+        old_username = (old or {}).get("twitch_username", "").lower()
+        if old_username and twitch_index.get(old_username, (None,))[0] == user_id:
+            del twitch_index[old_username]
+        username = new.get("twitch_username")
+        if username:
+            twitch_index[username.lower()] = (user_id, new.get("forward_command"), new.get("forward_direction"))
+
+    def get(self, user_id):
+        return self.users.get(user_id, {})
+
+    def put(self, user_id, user):
+        with self.lock:
+            old = self.users.get(user_id)
+            users = dict(self.users)
+            users[user_id] = user
+            twitch_index = dict(self.twitch_index)
+            self.index(twitch_index, user_id, old, user)
+            self.users, self.twitch_index = users, twitch_index
+        for listener in list(self.listeners):
+            listener(user_id, old, user)
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+user_state = UserState(load_users())
 
 def get_current_user_id():
     user_id = request.cookies.get("user_id")
@@ -43,13 +348,124 @@ def get_current_user_id():
     return user_id
 
 def get_user(user_id):
-    return users.get(user_id, {})
+    return user_state.get(user_id)
 
 def update_user(user_id, data):
-    user = users.get(user_id, {})
-    user.update(data)
-    users[user_id] = user
-    save_users(users)
+    # Held across the store write so concurrent updates from the Flask and
+    # bot threads reach user_state in the order they were committed.
+    with user_state.lock:
+        user = user_store.update(user_id, data)
+        user_state.put(user_id, user)
+    publish_user(user_id, user)
+
+# === METRICS ===
+
+METRIC_HELP = {
+    "youtube_api_requests_total": ("counter", "YouTube Data API responses by endpoint and HTTP status."),
+    "youtube_api_request_seconds": ("histogram", "YouTube Data API request latency by endpoint."),
+    "youtube_quota_units_spent": ("gauge", "YouTube quota units spent today."),
+    "youtube_quota_units_by_endpoint": ("gauge", "YouTube quota units spent today, by API endpoint."),
+    "youtube_quota_units_by_channel": ("gauge", "YouTube quota units spent today by the top spending YouTube channels."),
+    "token_refresh_total": ("counter", "OAuth token refreshes by provider and result."),
+    "youtube_poll_seconds": ("histogram", "Time to poll one user's live chat, including token and chat id lookups."),
+    "youtube_poll_wait_seconds": ("histogram", "Time a due poll waited for a free poll slot."),
+    "yt_to_twitch_lag_seconds": ("histogram", "Delay from a YouTube message's publishedAt to its Twitch send."),
+    "twitch_send_queue_depth": ("gauge", "Lines waiting in the Twitch outbound queues."),
+    "youtube_send_queue_depth": ("gauge", "Twitch->YouTube forwards waiting in the YouTube outbound queues."),
+    "twitch_event_message_seconds": ("histogram", "Time spent handling one Twitch chat message."),
+    "users": ("gauge", "Known user records."),
+    "websub_notifications_total": ("counter", "WebSub pushes received, by result."),
+    "suppressed_messages_total": ("counter", "Messages dropped before forwarding, by source platform and reason."),
+    "twitch_replies_dropped_total": ("counter", "Chat replies dropped because the channel's Twitch send queue was full."),
+    "account_circuit_opened_total": ("counter", "Times an account's requests were paused after repeated failures, by provider."),
+}
+
+class Metrics:
+    """Counters, histograms and gauges rendered in the Prometheus text format.
+
+    Recording is a few dict operations with no lock or I/O, so it is cheap
+    enough for the event loop's hot paths; /metrics works on a snapshot.
+    Gauges are callables evaluated only when a snapshot is taken; a gauge
+    with a label returns {label value: value}.
+    """
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> per-bucket counts (last is +Inf), then the sum
+        self.gauges = {}  # name -> (callable returning the current value, label or None)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(METRIC_BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(METRIC_BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    def gauge(self, name, fn, label=None):
+        self.gauges[name] = (fn, label)
+
+    def snapshot(self):
+        gauges = {}
+        for name, (fn, label) in list(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if label is None:
+                gauges[(name, ())] = value
+            else:
+                for key, labelled in list(value.items()):
+                    gauges[(name, ((label, key),))] = labelled
+        return {
+            "counters": dict(self.counters),
+            "histograms": {key: list(values) for key, values in list(self.histograms.items())},
+            "gauges": gauges,
+        }
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def render_metrics(snapshots):
+    """Render [(extra_labels, snapshot), ...] as one Prometheus exposition."""
+    families = {}
+    for extra, snap in snapshots:
+        for kind in ("counters", "gauges"):
+            for (name, labels), value in snap[kind].items():
+                families.setdefault(name, []).append(f"{name}{format_labels(extra + labels)} {value}")
+        for (name, labels), histogram in snap["histograms"].items():
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS + ("+Inf",), histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(extra + labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(extra + labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{format_labels(extra + labels)} {cumulative}")
+
+    out = []
+    for name in sorted(families):
+        kind, text = METRIC_HELP.get(name, ("untyped", ""))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(families[name])
+    return "\n".join(out) + "\n"
+
+def record_youtube_call(endpoint, status, started):
+    metrics.inc("youtube_api_requests_total", endpoint=endpoint, status=status)
+    metrics.observe("youtube_api_request_seconds", time.monotonic() - started, endpoint=endpoint)
+
+metrics = Metrics()
+metrics.gauge("users", lambda: len(user_state.users))
 
 # === FLASK ROUTES ===
 
@@ -64,6 +480,9 @@ def index():
         yt_channel=user.get("yt_channel"),
         forward_command=user.get("forward_command", ""),
         forward_direction=user.get("forward_direction", ""),
+        twitch_status=user.get("twitch_status"),
+        yt_status=user.get("yt_status"),
+        yt_retry_minutes=max(int((user.get("yt_retry_at", 0) - time.time()) // 60) + 1, 1),
         linked=True if ("twitch_token" in user or "yt_token" in user) else False
     ))
 
@@ -103,16 +522,16 @@ def callback():
     error = request.args.get("error")
 
     if error:
-        print(f"Auth error: {error}")
+        log.warning("Auth error: %s", error)
         return f"Error: {error}"
 
     if not code or not state:
-        print("Missing code or state in callback")
+        log.warning("Missing code or state in callback")
         return "Missing code or state", 400
 
     if state.startswith("twitch:"):
         user_id = state[len("twitch:"):]
-        token_url = "https://id.twitch.tv/oauth2/token"
+        token_url = TWITCH_TOKEN_URL
         payload = {
             "client_id": TWITCH_CLIENT_ID,
             "client_secret": TWITCH_CLIENT_SECRET,
@@ -122,7 +541,7 @@ def callback():
         }
         resp = requests.post(token_url, data=payload)
         if resp.status_code != 200:
-            print(f"Failed to get Twitch token: {resp.text}")
+            log.error("Failed to get Twitch token: %s", resp.text, extra={"user_id": user_id})
             return f"Failed to get Twitch token: {resp.text}", 500
         data = resp.json()
         access_token = data.get("access_token")
@@ -130,7 +549,7 @@ def callback():
         headers = {"Authorization": f"Bearer {access_token}", "Client-Id": TWITCH_CLIENT_ID}
         user_resp = requests.get("https://api.twitch.tv/helix/users", headers=headers)
         if user_resp.status_code != 200:
-            print(f"Failed to get Twitch user info: {user_resp.text}")
+            log.error("Failed to get Twitch user info: %s", user_resp.text, extra={"user_id": user_id})
             return f"Failed to get Twitch user info: {user_resp.text}", 500
         user_data = user_resp.json()
         username = user_data["data"][0]["login"]
@@ -139,11 +558,12 @@ def callback():
             "twitch_refresh": refresh_token,
             "twitch_username": username,
             "twitch_token_expiry": time.time() + data.get("expires_in", 0),
+            "twitch_status": "ok",
         })
 
     elif state.startswith("yt:"):
         user_id = state[len("yt:"):]
-        token_url = "https://oauth2.googleapis.com/token"
+        token_url = YT_TOKEN_URL
         payload = {
             "code": code,
             "client_id": YT_CLIENT_ID,
@@ -153,16 +573,16 @@ def callback():
         }
         resp = requests.post(token_url, data=payload)
         if resp.status_code != 200:
-            print(f"Failed to get YouTube token: {resp.text}")
+            log.error("Failed to get YouTube token: %s", resp.text, extra={"user_id": user_id})
             return f"Failed to get YouTube token: {resp.text}", 500
         data = resp.json()
         access_token = data.get("access_token")
         refresh_token = data.get("refresh_token")
         expires_in = data.get("expires_in", 0)
         headers = {"Authorization": f"Bearer {access_token}"}
-        yt_resp = requests.get("https://www.googleapis.com/youtube/v3/channels?part=id&mine=true", headers=headers)
+        yt_resp = requests.get(f"{YT_API_BASE}/channels?part=id&mine=true", headers=headers)
         if yt_resp.status_code != 200:
-            print(f"Failed to get YouTube channel info: {yt_resp.text}")
+            log.error("Failed to get YouTube channel info: %s", yt_resp.text, extra={"user_id": user_id})
             return f"Failed to get YouTube channel info: {yt_resp.text}", 500
         yt_data = yt_resp.json()
         channel_id = yt_data["items"][0]["id"]
@@ -170,192 +590,1370 @@ def callback():
             "yt_token": access_token,
             "yt_refresh": refresh_token,
             "yt_channel": channel_id,
-            "yt_token_expiry": time.time() + expires_in
+            "yt_token_expiry": time.time() + expires_in,
+            "yt_status": "ok",
         })
 
     else:
-        print("Invalid state format in callback")
+        log.warning("Invalid state format in callback")
         return "Invalid state format", 400
 
     resp = make_response(redirect("/"))
     resp.set_cookie("user_id", user_id, max_age=60*60*24*365)
     return resp
 
+@app.route("/metrics")
+def metrics_endpoint():
+    snapshots = [((), metrics.snapshot())]
+    if shard_coordinator is not None:
+        snapshots += shard_coordinator.metrics_snapshots()
+    resp = make_response(render_metrics(snapshots))
+    resp.mimetype = "text/plain"
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return resp
+
+@app.route("/websub", methods=["GET"])
+def websub_verify():
+    mode = request.args.get("hub.mode")
+    channel_id = websub.channel_for_topic(request.args.get("hub.topic", ""))
+    # Only answers for a subscription we asked for: this endpoint is public
+    # and channel ids are not secret. We never unsubscribe, so those
+    # verifications (which anyone can trigger at the hub) are refused.
+    if mode == "subscribe" and websub.outstanding(channel_id, request.args.get("hub.verify_token", "")):
+        try:
+            lease_seconds = int(request.args.get("hub.lease_seconds", WEBSUB_LEASE))
+        except ValueError:
+            lease_seconds = 0
+        if lease_seconds <= 0:
+            log.warning("Ignoring WebSub verification with lease %r", request.args.get("hub.lease_seconds"), extra={"yt_channel": channel_id})
+            return "Invalid hub.lease_seconds", 400
+        websub.verified(channel_id, min(lease_seconds, WEBSUB_LEASE))
+        return request.args.get("hub.challenge", ""), 200, {"Content-Type": "text/plain"}
+    if mode == "denied" and websub.outstanding(channel_id):
+        log.warning("WebSub hub denied subscription: %s", request.args.get("hub.reason"), extra={"yt_channel": channel_id})
+        websub.set_lease(channel_id, 0)
+        return "", 200
+    return "Unknown topic", 404
+
+@app.route("/websub", methods=["POST"])
+def websub_push():
+    # Pushes that fail the signature check are still acknowledged, as
+    # WebSub asks, so the hub does not keep retrying them.
+    body = request.get_data()
+    if not websub.signature_ok(body, request.headers.get("X-Hub-Signature", "")):
+        log.warning("Ignoring WebSub push with a bad signature")
+        metrics.inc("websub_notifications_total", result="bad_signature")
+        return "", 204
+    metrics.inc("websub_notifications_total", result="accepted")
+    for channel_id, video_ids in parse_websub_feed(body).items():
+        handoff_live_candidates(channel_id, video_ids)
+    return "", 204
+
 @app.route("/set_forward", methods=["POST"])
 def set_forward():
     user_id = get_current_user_id()
     command = request.form.get("command", "").strip()
     direction = request.form.get("direction", "").strip()
     if not command or direction not in ("yt_to_twitch", "twitch_to_yt"):
-        print(f"Invalid input for set_forward: command={command}, direction={direction}")
+        log.warning("Invalid input for set_forward: command=%s, direction=%s", command, direction)
         return "Invalid input", 400
 
     update_user(user_id, {
         "forward_command": command,
         "forward_direction": direction
     })
-    print(f"Set forward for user {user_id}: command={command}, direction={direction}")
+    log.info("Set forward: command=%s, direction=%s", command, direction, extra={"user_id": user_id})
     return redirect("/")
 
-# === TOKEN REFRESH LOGIC ===
+# === ACCOUNT HEALTH ===
 
-def refresh_youtube_token(user_id):
-    user = get_user(user_id)
-    if not user or "yt_refresh" not in user:
-        print(f"No YouTube refresh token for user {user_id}")
-        return False
+class AccountHealth:
+    """Per-account circuit breaker for OAuth and YouTube API failures.
 
-    token_url = "https://oauth2.googleapis.com/token"
-    payload = {
-        "client_id": YT_CLIENT_ID,
-        "client_secret": YT_CLIENT_SECRET,
-        "refresh_token": user["yt_refresh"],
-        "grant_type": "refresh_token"
-    }
-    resp = requests.post(token_url, data=payload)
-    if resp.status_code != 200:
-        print(f"Failed to refresh YouTube token for user {user_id}: {resp.text}")
-        return False
-    data = resp.json()
-    access_token = data.get("access_token")
-    expires_in = data.get("expires_in", 0)
-    update_user(user_id, {
-        "yt_token": access_token,
-        "yt_token_expiry": time.time() + expires_in
-    })
-    print(f"Refreshed YouTube token for user {user_id}")
-    return True
+    After BREAKER_THRESHOLD consecutive failures an account's requests are
+    paused, for twice as long after every further failure; the first attempt
+    after a pause either clears it or extends it. A revoked refresh token
+    cannot recover, so the account is marked as needing re-auth until the
+    user links it again. The status is kept in the user record for the
+    index page.
+    """
+
+    def __init__(self):
+        self.failures = {}  # (provider, user_id) -> consecutive failures
+        self.open_until = {}  # (provider, user_id) -> time before which no request is made
+
+    def retry_in(self, provider, user_id):
+        return max(self.open_until.get((provider, user_id), 0) - time.time(), 0)
 
-def refresh_twitch_token(user_id):
-    user = get_user(user_id)
-    if not user or "twitch_refresh" not in user:
-        print(f"No Twitch refresh token for user {user_id}")
+    def failed(self, provider, user_id):
+        key = (provider, user_id)
+        failures = self.failures[key] = self.failures.get(key, 0) + 1
+        if failures < BREAKER_THRESHOLD:
+            return
+        delay = min(BREAKER_BASE * 2 ** min(failures - BREAKER_THRESHOLD, 16), BREAKER_MAX)
+        retry_at = self.open_until[key] = time.time() + delay
+        metrics.inc("account_circuit_opened_total", provider=provider)
+        log.warning("Pausing %s requests for %ds after %d failures", TokenManager.PROVIDERS[provider][3], delay, failures, extra={"user_id": user_id})
+        update_user(user_id, {f"{provider}_status": "backoff", f"{provider}_retry_at": retry_at})
+
+    def succeeded(self, provider, user_id):
+        self.reset(provider, user_id)
+        if get_user(user_id).get(f"{provider}_status") == "backoff":
+            log.info("Resuming %s requests", TokenManager.PROVIDERS[provider][3], extra={"user_id": user_id})
+            update_user(user_id, {f"{provider}_status": "ok"})
+
+    def revoked(self, provider, user_id):
+        self.reset(provider, user_id)
+        log.warning("%s access was revoked, waiting for the user to link again", TokenManager.PROVIDERS[provider][3], extra={"user_id": user_id})
+        update_user(user_id, {f"{provider}_status": "reauth"})
+
+    def reset(self, provider, user_id):
+        self.failures.pop((provider, user_id), None)
+        self.open_until.pop((provider, user_id), None)
+
+def is_revoked(status, text):
+    # Google answers invalid_grant, Twitch "Invalid refresh token"; either
+    # way the refresh token is dead and only a new link helps.
+    if status not in (400, 401):
         return False
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return False
+    return data.get("error") == "invalid_grant" or data.get("message") == "Invalid refresh token"
+
+def note_account_error(user_id, status, text):
+    # Quota and rate limit errors are shared by every account, so they do
+    # not count against this one.
+    if youtube_error_reason(text) not in ("quotaExceeded", "rateLimitExceeded"):
+        account_health.failed("yt", user_id)
+
+account_health = AccountHealth()
+
+# === TOKEN REFRESH LOGIC ===
+
+class TokenManager:
+    """Async OAuth refresh for both providers.
 
-    token_url = "https://id.twitch.tv/oauth2/token"
-    payload = {
-        "grant_type": "refresh_token",
-        "refresh_token": user["twitch_refresh"],
-        "client_id": TWITCH_CLIENT_ID,
-        "client_secret": TWITCH_CLIENT_SECRET,
+    Concurrent callers for the same user and provider share one refresh, and a
+    background sweep renews tokens before they expire so the forwarding paths
+    rarely have to wait on an OAuth round-trip.
+    """
+
+    PROVIDERS = {
+        "yt": ("yt_token", "yt_refresh", "yt_token_expiry", "YouTube"),
+        "twitch": ("twitch_token", "twitch_refresh", "twitch_token_expiry", "Twitch"),
     }
-    resp = requests.post(token_url, data=payload)
-    if resp.status_code != 200:
-        print(f"Failed to refresh Twitch token for user {user_id}: {resp.text}")
+    # Only tokens the bot calls an API with are renewed ahead of time; the
+    # user's Twitch token is not used (the bot chats as TWITCH_BOT_TOKEN).
+    SWEPT = ("yt",)
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.inflight = {}  # (provider, user_id) -> asyncio.Task
+
+    async def start(self):
+        while True:
+            await self.refresh_expiring()
+            await asyncio.sleep(TOKEN_SWEEP_INTERVAL)
+
+    async def refresh_expiring(self):
+        deadline = time.time() + TOKEN_REFRESH_AHEAD
+        refreshes = []
+        for user_id, user in user_state.users.items():
+            if not owns_user(user_id):
+                continue
+            for provider in self.SWEPT:
+                _, refresh_key, expiry_key, _ = self.PROVIDERS[provider]
+                if refresh_key in user and user.get(expiry_key, 0) < deadline:
+                    refreshes.append(self.refresh(user_id, provider))
+        if refreshes:
+            await asyncio.gather(*refreshes, return_exceptions=True)
+
+    async def youtube_token(self, user_id):
+        """Return a usable YouTube access token, refreshing first only if it is about to expire."""
+        user = get_user(user_id)
+        if "yt_token" in user and time.time() < user.get("yt_token_expiry", 0) - TOKEN_REFRESH_MARGIN:
+            return user["yt_token"]
+        if not await self.refresh(user_id, "yt"):
+            return None
+        return get_user(user_id).get("yt_token")
+
+    def refresh(self, user_id, provider):
+        key = (provider, user_id)
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self.do_refresh(user_id, provider))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return asyncio.shield(task)
+
+    async def do_refresh(self, user_id, provider):
+        token_key, refresh_key, expiry_key, name = self.PROVIDERS[provider]
+        user = get_user(user_id)
+        if not user or refresh_key not in user:
+            log.warning("No %s refresh token", name, extra=throttled(user_id=user_id))
+            return False
+        if user.get(f"{provider}_status") == "reauth" or account_health.retry_in(provider, user_id):
+            return False
+
+        if provider == "yt":
+            token_url = YT_TOKEN_URL
+            client_id, client_secret = YT_CLIENT_ID, YT_CLIENT_SECRET
+        else:
+            token_url = TWITCH_TOKEN_URL
+            client_id, client_secret = TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET
+        payload = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "refresh_token": user[refresh_key],
+            "grant_type": "refresh_token",
+        }
+        try:
+            async with self.bot.get_http_session().post(token_url, data=payload) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    log.error("Failed to refresh %s token: %s", name, text, extra=throttled(user_id=user_id))
+                    if is_revoked(resp.status, text):
+                        metrics.inc("token_refresh_total", provider=provider, result="revoked")
+                        account_health.revoked(provider, user_id)
+                    else:
+                        metrics.inc("token_refresh_total", provider=provider, result="failed")
+                        account_health.failed(provider, user_id)
+                    return False
+                data = await resp.json()
+        except Exception as e:
+            log.error("Failed to refresh %s token: %s", name, e, extra=throttled(user_id=user_id))
+            metrics.inc("token_refresh_total", provider=provider, result="failed")
+            account_health.failed(provider, user_id)
+            return False
+
+        update = {
+            token_key: data.get("access_token"),
+            expiry_key: time.time() + data.get("expires_in", 0),
+        }
+        if data.get("refresh_token"):
+            update[refresh_key] = data["refresh_token"]  # Twitch rotates refresh tokens
+        update_user(user_id, update)
+        account_health.succeeded(provider, user_id)
+        metrics.inc("token_refresh_total", provider=provider, result="ok")
+        log.info("Refreshed %s token", name, extra={"user_id": user_id})
+        return True
+
+# === YOUTUBE QUOTA BUDGET ===
+
+try:
+    QUOTA_TZ = ZoneInfo("America/Los_Angeles")  # YouTube quota resets at midnight Pacific
+except Exception:
+    QUOTA_TZ = timezone.utc
+
+class QuotaBudget:
+    """Units spent against the daily YouTube Data API quota, per user and per endpoint."""
+
+    def __init__(self, daily_budget):
+        self.daily_budget = daily_budget
+        self.day = None
+        self.spent = 0
+        self.by_endpoint = {}
+        self.by_user = {}
+        self.exhausted = False  # set on a quotaExceeded error, cleared at the daily reset
+
+    def roll(self):
+        today = datetime.now(QUOTA_TZ).date()
+        if today != self.day:
+            self.day = today
+            self.spent = 0
+            self.by_endpoint = {}
+            self.by_user = {}
+            self.exhausted = False
+
+    def record(self, user_id, endpoint):
+        self.roll()
+        cost = YT_QUOTA_COSTS[endpoint]
+        self.spent += cost
+        self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + cost
+        self.by_user[user_id] = self.by_user.get(user_id, 0) + cost
+
+    def can_spend(self, endpoint):
+        self.roll()
+        return not self.exhausted and self.spent + YT_QUOTA_COSTS[endpoint] <= self.daily_budget
+
+    def mark_exhausted(self):
+        self.roll()
+        self.exhausted = True
+
+    def seconds_until_reset(self):
+        now = datetime.now(QUOTA_TZ)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=QUOTA_TZ)
+        return (midnight - now).total_seconds()
+
+    def pace(self):
+        """Multiplier (>= 1) for poll intervals when spending runs ahead of the clock."""
+        self.roll()
+        elapsed = max(1 - self.seconds_until_reset() / 86400, 0.05)
+        used = self.spent / self.daily_budget if self.daily_budget else 1
+        return max(1.0, used / elapsed)
+
+    def top_channels(self, count):
+        # By YouTube channel rather than user id: user ids double as the
+        # login cookie and must not appear on /metrics.
+        by_channel = {}
+        for user_id, units in list(self.by_user.items()):
+            channel_id = get_user(user_id).get("yt_channel", "unknown")
+            by_channel[channel_id] = by_channel.get(channel_id, 0) + units
+        return dict(sorted(by_channel.items(), key=lambda item: item[1], reverse=True)[:count])
+
+quota_budget = QuotaBudget(YT_DAILY_QUOTA)
+metrics.gauge("youtube_quota_units_spent", lambda: quota_budget.spent)
+metrics.gauge("youtube_quota_units_by_endpoint", lambda: quota_budget.by_endpoint, label="endpoint")
+metrics.gauge("youtube_quota_units_by_channel", lambda: quota_budget.top_channels(QUOTA_TOP_CHANNELS), label="yt_channel")
+
+# === LIVE CHAT RESOLUTION CACHE ===
+
+def youtube_error_reason(text):
+    try:
+        return json.loads(text)["error"]["errors"][0]["reason"]
+    except Exception:
+        return None
+
+def note_youtube_error(status, text):
+    if status == 403 and youtube_error_reason(text) == "quotaExceeded":
+        log.warning("YouTube daily quota exceeded, pausing API calls until the reset")
+        quota_budget.mark_exhausted()
+
+def is_chat_gone(status, text):
+    # 404 means the chat no longer exists; a 403 is only "chat ended/disabled"
+    # when it is not a quota or rate limit error.
+    if status == 404:
+        return True
+    return status == 403 and youtube_error_reason(text) not in ("quotaExceeded", "rateLimitExceeded")
+
+class LiveChatCache:
+    def __init__(self):
+        self.entries = {}  # yt_channel -> (expires_at, live_chat_id, error)
+        self.pending = {}  # yt_channel -> asyncio.Task, so concurrent lookups share one search
+        self.misses = {}  # yt_channel -> consecutive "not live" answers, for backoff
+        self.leases = {}  # yt_channel -> time its hub-verified WebSub lease ends
+
+    async def resolve(self, user_id, user, session):
+        """Return (live_chat_id, error) for the user's channel, searching only on a cache miss."""
+        channel_id = user["yt_channel"]
+        entry = self.entries.get(channel_id)
+        if entry and entry[0] > time.time():
+            return entry[1], entry[2]
+
+        return await self.shared(channel_id, lambda: self.lookup(user_id, user, session))
+
+    async def confirm(self, user_id, user, video_ids, session):
+        """Check videos announced by a WebSub push with one videos.list call."""
+        channel_id = user["yt_channel"]
+        entry = self.entries.get(channel_id)
+        if entry and entry[1] and entry[0] > time.time():
+            return entry[1], entry[2]  # already live; the push is about another video
+        return await self.shared(channel_id, lambda: self.lookup_pushed(user_id, user, video_ids, session))
+
+    async def shared(self, channel_id, make_lookup):
+        task = self.pending.get(channel_id)
+        if task is None:
+            task = asyncio.create_task(make_lookup())
+            self.pending[channel_id] = task
+            task.add_done_callback(lambda _: self.pending.pop(channel_id, None))
+        return await asyncio.shield(task)
+
+    def invalidate(self, channel_id):
+        self.entries.pop(channel_id, None)
+
+    def expires_in(self, channel_id):
+        entry = self.entries.get(channel_id)
+        return max(entry[0] - time.time(), 0) if entry else 0
+
+    def store(self, channel_id, live_chat_id, error):
+        if live_chat_id:
+            self.misses.pop(channel_id, None)
+            ttl = LIVE_CACHE_TTL
+        else:
+            # Offline channels are re-searched less and less often, and
+            # later still when the day's quota is running ahead of schedule.
+            # While the hub holds a verified subscription a new stream is
+            # pushed to us, so the cap is much longer.
+            misses = self.misses[channel_id] = self.misses.get(channel_id, 0) + 1
+            cap = NOT_LIVE_WEBSUB_TTL if self.leases.get(channel_id, 0) > time.time() else NOT_LIVE_MAX_TTL
+            ttl = min(NOT_LIVE_CACHE_TTL * 2 ** (misses - 1), cap) * quota_budget.pace()
+        self.entries[channel_id] = (time.time() + ttl, live_chat_id, error)
+        return live_chat_id, error
+
+    async def lookup(self, user_id, user, session):
+        channel_id = user["yt_channel"]
+        headers = {"Authorization": f"Bearer {user['yt_token']}"}
+
+        if not quota_budget.can_spend("search.list"):
+            return None, "YouTube quota exhausted"
+        url = f"{YT_API_BASE}/search?part=snippet&channelId={channel_id}&eventType=live&type=video"
+        quota_budget.record(user_id, "search.list")
+        started = time.monotonic()
+        async with session.get(url, headers=headers) as resp:
+            record_youtube_call("search.list", resp.status, started)
+            if resp.status != 200:
+                text = await resp.text()
+                log.warning("YT Live search failed: %s", text, extra=throttled(user_id=user_id))
+                note_youtube_error(resp.status, text)
+                note_account_error(user_id, resp.status, text)
+                return None, "No live stream found"
+            data = await resp.json()
+        account_health.succeeded("yt", user_id)
+
+        items = data.get("items", [])
+        if not items:
+            log.debug("No live stream found", extra={"user_id": user_id})
+            return self.store(channel_id, None, "No live stream found")
+
+        live_video_id = items[0]["id"]["videoId"]
+        log.info("Found live stream %s", live_video_id, extra={"user_id": user_id})
+
+        items = await self.video_details(user_id, user, [live_video_id], session)
+        if items is None:
+            return None, "Could not get live stream details"
+        live_chat_id = active_live_chat(items)
+        if not live_chat_id:
+            log.info("No active live chat for video %s", live_video_id, extra={"user_id": user_id})
+            return self.store(channel_id, None, "No active live chat")
+
+        return self.store(channel_id, live_chat_id, None)
+
+    async def lookup_pushed(self, user_id, user, video_ids, session):
+        if not quota_budget.can_spend("videos.list"):
+            return None, "YouTube quota exhausted"
+        items = await self.video_details(user_id, user, video_ids, session)
+        if items is None:
+            return None, "Could not get live stream details"
+        live_chat_id = active_live_chat(items)
+        if live_chat_id:
+            log.info("WebSub push confirmed a live stream", extra={"user_id": user_id})
+            return self.store(user["yt_channel"], live_chat_id, None)
+        return self.store(user["yt_channel"], None, "No live stream found")
+
+    async def video_details(self, user_id, user, video_ids, session):
+        """liveStreamingDetails for up to 50 videos at one quota unit; None on failure."""
+        headers = {"Authorization": f"Bearer {user['yt_token']}"}
+        details_url = f"{YT_API_BASE}/videos?part=liveStreamingDetails&id={','.join(video_ids[:50])}"
+        quota_budget.record(user_id, "videos.list")
+        started = time.monotonic()
+        async with session.get(details_url, headers=headers) as details_resp:
+            record_youtube_call("videos.list", details_resp.status, started)
+            if details_resp.status != 200:
+                text = await details_resp.text()
+                log.warning("YT Live details failed: %s", text, extra=throttled(user_id=user_id))
+                note_youtube_error(details_resp.status, text)
+                note_account_error(user_id, details_resp.status, text)
+                return None
+            return (await details_resp.json()).get("items", [])
+
+def active_live_chat(items):
+    for item in items:
+        live_chat_id = item.get("liveStreamingDetails", {}).get("activeLiveChatId")
+        if live_chat_id:
+            return live_chat_id
+    return None
+
+live_chat_cache = LiveChatCache()
+
+# === WEBSUB LIVE NOTIFICATIONS ===
+
+WEBSUB_TOPIC = "https://www.youtube.com/xml/feeds/videos.xml?channel_id="
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+YT_NS = "{http://www.youtube.com/xml/schemas/2015}"
+
+class WebSubSubscriber:
+    """Keeps a WebSub subscription to the video feed of every linked YouTube channel.
+
+    Runs on the Flask side. YouTube's hub pushes a feed entry when a channel
+    publishes or updates a video, which includes a stream starting; the bot
+    checks it with videos.list, so offline channels no longer need searching.
+    """
+
+    def __init__(self):
+        self.leases = {}  # yt_channel -> time the hub-verified lease ends
+        self.requested = {}  # yt_channel -> time a subscription was last requested
+        self.verify_tokens = {}  # yt_channel -> hub.verify_token of the outstanding request
+        self.wake = threading.Event()
+
+    def start(self):
+        user_state.subscribe(self.user_changed)
+        threading.Thread(target=self.run, name="websub", daemon=True).start()
+
+    def user_changed(self, user_id, old, new):
+        if new.get("yt_channel") and new.get("yt_channel") != (old or {}).get("yt_channel"):
+            self.wake.set()
+
+    def wanted_channels(self):
+        return {user["yt_channel"] for user in user_state.users.values() if "yt_channel" in user}
+
+    def channel_for_topic(self, topic):
+        return parse_qs(urlparse(topic).query).get("channel_id", [None])[0]
+
+    def outstanding(self, channel_id, verify_token=None):
+        """Whether the hub may be answering our own recent request for this channel.
+
+        Without a token only the request's age is checked (denials carry none).
+        """
+        expected = self.verify_tokens.get(channel_id)
+        if expected is None or time.time() - self.requested.get(channel_id, 0) > WEBSUB_RETRY:
+            return False
+        return verify_token is None or hmac.compare_digest(verify_token, expected)
+
+    def verified(self, channel_id, lease_seconds):
+        self.verify_tokens.pop(channel_id, None)
+        log.info("WebSub subscription verified for %ds", lease_seconds, extra={"yt_channel": channel_id})
+        self.set_lease(channel_id, time.time() + lease_seconds)
+
+    def set_lease(self, channel_id, ends_at):
+        # The pollers (here, or in every shard) only trust a long "not live"
+        # cache for channels whose subscription the hub actually verified.
+        self.leases[channel_id] = ends_at
+        live_chat_cache.leases[channel_id] = ends_at
+        if shard_coordinator is not None:
+            shard_coordinator.broadcast(("lease", channel_id, ends_at))
+
+    def signature_ok(self, body, header):
+        method, _, signature = header.partition("=")
+        if method not in ("sha1", "sha256", "sha384", "sha512"):
+            return False
+        expected = hmac.new(WEBSUB_SECRET.encode(), body, method).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def run(self):
+        while True:
+            now = time.time()
+            for channel_id in self.wanted_channels():
+                if self.leases.get(channel_id, 0) - now > WEBSUB_RENEW_MARGIN:
+                    continue
+                if now - self.requested.get(channel_id, 0) < WEBSUB_RETRY:
+                    continue
+                self.subscribe(channel_id)
+            self.wake.wait(WEBSUB_CHECK_INTERVAL)
+            self.wake.clear()
+
+    def subscribe(self, channel_id):
+        self.requested[channel_id] = time.time()
+        verify_token = self.verify_tokens[channel_id] = uuid.uuid4().hex
+        payload = {
+            "hub.callback": f"{PUBLIC_URL}/websub",
+            "hub.mode": "subscribe",
+            "hub.topic": WEBSUB_TOPIC + channel_id,
+            "hub.verify": "async",
+            "hub.verify_token": verify_token,
+            "hub.lease_seconds": WEBSUB_LEASE,
+            "hub.secret": WEBSUB_SECRET,
+        }
+        try:
+            resp = requests.post(WEBSUB_HUB, data=payload, timeout=HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            log.warning("WebSub subscribe request failed: %s", e, extra={"yt_channel": channel_id})
+            return
+        if resp.status_code not in (202, 204):
+            log.warning("WebSub hub refused subscription: %s %s", resp.status_code, resp.text, extra={"yt_channel": channel_id})
+
+def parse_websub_feed(body):
+    """Map channel id -> video ids announced in a pushed Atom feed."""
+    try:
+        feed = ElementTree.fromstring(body)
+    except ElementTree.ParseError:
+        return {}
+    videos = defaultdict(list)
+    for entry in feed.iter(f"{ATOM_NS}entry"):
+        video_id = entry.findtext(f"{YT_NS}videoId")
+        channel_id = entry.findtext(f"{YT_NS}channelId")
+        if video_id and channel_id:
+            videos[channel_id].append(video_id)
+    return videos
+
+def handoff_live_candidates(channel_id, video_ids):
+    # Called on a Flask thread: the check runs on the loop of the bot that
+    # serves each user linked to the channel, in this process or a shard.
+    for user_id, user in user_state.users.items():
+        if user.get("yt_channel") != channel_id:
+            continue
+        if shard_coordinator is not None:
+            shard_coordinator.send(user_id, ("live", user_id, channel_id, video_ids))
+        elif local_bot is not None:
+            local_bot.loop.call_soon_threadsafe(local_bot.live_candidates, user_id, channel_id, video_ids)
+
+websub = WebSubSubscriber()
+
+# === ECHO AND DUPLICATE SUPPRESSION ===
+
+class FingerprintWindow:
+    """Fingerprints seen in the last `window` seconds: a hashed ring buffer.
+
+    Entries are 8-byte digests kept in arrival order with a dict for
+    lookups, and at most `capacity` are held, so a spam storm cannot grow it.
+    """
+
+    def __init__(self, window, capacity):
+        self.window = window
+        self.capacity = capacity
+        self.order = deque()  # (expires_at, fingerprint), oldest first
+        self.expiry = {}  # fingerprint -> expires_at
+
+    def __contains__(self, fingerprint):
+        return self.expiry.get(fingerprint, 0) > time.monotonic()
+
+    def add(self, fingerprint):
+        """Remember the fingerprint; returns whether it was already live.
+
+        A repeat does not restart the window, so text that keeps coming
+        back still gets through once per window.
+        """
+        now = time.monotonic()
+        while self.order and (self.order[0][0] <= now or len(self.order) >= self.capacity):
+            expires_at, old = self.order.popleft()
+            if self.expiry.get(old) == expires_at:
+                del self.expiry[old]
+        if self.expiry.get(fingerprint, 0) > now:
+            return True
+        self.expiry[fingerprint] = now + self.window
+        self.order.append((now + self.window, fingerprint))
         return False
-    data = resp.json()
-    access_token = data.get("access_token")
-    refresh_token = data.get("refresh_token")
-    expires_in = data.get("expires_in", 0)
-    update_user(user_id, {
-        "twitch_token": access_token,
-        "twitch_refresh": refresh_token,
-        "twitch_token_expiry": time.time() + expires_in,
-    })
-    print(f"Refreshed Twitch token for user {user_id}")
-    return True
+
+def normalize_text(text):
+    # Case, punctuation and spacing changes do not make a message new.
+    normalized = " ".join("".join(ch if ch.isalnum() else " " for ch in text.casefold()).split())
+    return normalized or text.strip()
+
+def fingerprint(scope, text):
+    return hashlib.blake2b(f"{scope}\0{normalize_text(text)}".encode(), digest_size=8).digest()
+
+class MessageFilter:
+    """Drops echoes and duplicate storms before they cost an API call.
+
+    Scopes name one chat on one platform ("yt:<channel>", "tw:<channel>").
+    A message is an echo if it carries one of the bot's own prefixes or the
+    bot just forwarded the same text into that chat, and a duplicate if the
+    same author said the same thing there within the window. Different
+    viewers saying "gg" are not duplicates of each other.
+    """
+
+    def __init__(self):
+        self.recent = FingerprintWindow(DEDUP_WINDOW, DEDUP_CAPACITY)
+        self.echoes = FingerprintWindow(DEDUP_WINDOW, DEDUP_CAPACITY)
+
+    def check(self, source, author, text):
+        """Return why the message should be dropped ("echo" or "duplicate"), or None."""
+        if text.lstrip().casefold().startswith(ECHO_PREFIXES) or fingerprint(source, text) in self.echoes:
+            reason = "echo"
+        elif self.recent.add(fingerprint(f"{source}\0{author}", text)):
+            reason = "duplicate"
+        else:
+            return None
+        metrics.inc("suppressed_messages_total", source=source.split(":", 1)[0], reason=reason)
+        return reason
+
+    def forwarded(self, destination, text):
+        self.echoes.add(fingerprint(destination, text))
+
+message_filter = MessageFilter()
 
 # === YOUTUBE LIVE CHAT POLLING + FORWARDING ===
 
+class RecentIds:
+    """Fixed-size window of recently seen ids: a ring buffer backed by a set."""
+
+    def __init__(self, maxlen=SEEN_MESSAGE_WINDOW):
+        self.order = deque()
+        self.ids = set()
+        self.maxlen = maxlen
+
+    def __contains__(self, item):
+        return item in self.ids
+
+    def add(self, item):
+        if item in self.ids:
+            return
+        if len(self.order) >= self.maxlen:
+            self.ids.discard(self.order.popleft())
+        self.order.append(item)
+        self.ids.add(item)
+
+def published_time(message):
+    try:
+        return datetime.fromisoformat(message["snippet"]["publishedAt"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, ValueError, AttributeError):
+        return None
+
+class ChatCursor:
+    def __init__(self, live_chat_id):
+        self.live_chat_id = live_chat_id
+        self.page_token = None
+        self.seen = RecentIds()
+
+    def dump(self):
+        seen = list(self.seen.order)[-CHECKPOINT_SEEN_IDS:]
+        return {"live_chat_id": self.live_chat_id, "page_token": self.page_token, "seen": seen}
+
+    @classmethod
+    def load(cls, state):
+        cursor = cls(state["live_chat_id"])
+        cursor.page_token = state["page_token"]
+        for msg_id in state["seen"]:
+            cursor.seen.add(msg_id)
+        return cursor
+
+class ChatTransport:
+    """How the poller gets a user's new live chat messages.
+
+    fetch() returns (seconds to wait before the next fetch, new messages);
+    close() drops anything the transport holds open for the user.
+
+    PollingTransport is the only implementation. YouTube's push alternative,
+    liveChatMessages.streamList, is only served over gRPC, and streaming
+    is not implemented until the bot has a gRPC client for it.
+    """
+
+    def __init__(self, poller):
+        self.poller = poller
+
+    async def fetch(self, user_id, session):
+        raise NotImplementedError
+
+    def close(self, user_id):
+        pass
+
+class PollingTransport(ChatTransport):
+    """liveChatMessages.list at YouTube's pollingIntervalMillis, POLL_CONCURRENCY users at a time."""
+
+    async def fetch(self, user_id, session):
+        due = time.monotonic()
+        async with self.poller.semaphore:
+            started = time.monotonic()
+            metrics.observe("youtube_poll_wait_seconds", started - due)
+            result = await self.poll(user_id, session)
+            metrics.observe("youtube_poll_seconds", time.monotonic() - started)
+        return result
+
+    async def poll(self, user_id, session):
+        try:
+            delay, user, cursor = await self.poller.prepare(user_id, "liveChatMessages.list", session)
+            if cursor is None:
+                return delay, []
+
+            headers = {"Authorization": f"Bearer {user['yt_token']}"}
+            chat_url = f"{YT_API_BASE}/liveChat/messages?liveChatId={cursor.live_chat_id}&part=snippet,authorDetails"
+            if cursor.page_token:
+                chat_url += f"&pageToken={cursor.page_token}"
+            quota_budget.record(user_id, "liveChatMessages.list")
+            started = time.monotonic()
+            async with session.get(chat_url, headers=headers) as chat_resp:
+                record_youtube_call("liveChatMessages.list", chat_resp.status, started)
+                if chat_resp.status != 200:
+                    self.poller.chat_error(user_id, user, cursor, chat_resp.status, await chat_resp.text())
+                    return DEFAULT_POLL_INTERVAL, []
+                chat_data = await chat_resp.json()
+
+            new_messages = self.poller.accept(user_id, cursor, chat_data)
+            base = max(chat_data.get("pollingIntervalMillis", 0) / 1000, MIN_POLL_INTERVAL)
+            return self.poller.next_interval(user_id, base, bool(new_messages)), new_messages
+
+        except Exception as e:
+            log.error("Error polling YouTube live chat: %s", e, extra=throttled(user_id=user_id))
+            return DEFAULT_POLL_INTERVAL, []
+
 class YouTubeLiveChatPoller:
     def __init__(self, bot):
         self.bot = bot
         self.running = True
-        self.last_message_ids = {}  # user_id -> set(message_ids)
+        self.cursors = {}  # user_id -> ChatCursor for the user's current live chat
+        self.user_tasks = {}  # user_id -> asyncio.Task fetching that user's chat
+        self.idle_polls = {}  # user_id -> consecutive polls of a live chat with no new messages
+        self.semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+        self.changes = asyncio.Queue()  # user ids to re-check; None re-checks everyone
+        self.wakeups = {}  # user_id -> asyncio.Event that cuts the user's current wait short
+        self.checkpointed = {}  # checkpoint key -> data as last written, so only changes are saved
+        self.transport = PollingTransport(self)
 
     async def start(self):
-        async with ClientSession() as session:
-            try:
-                while self.running:
-                    await self.poll_all_users(session)
-                    await asyncio.sleep(5)  # poll every 5 seconds
-            finally:
-                await session.close()
-
-    async def poll_all_users(self, session):
-        for user_id, user in list(users.items()):
-            if "yt_token" not in user or "yt_channel" not in user or "forward_direction" not in user:
-                print(f"Skipping user {user_id}: Missing YouTube token, channel, or forward direction")
+        try:
+            await self.restore()
+            self.schedule_users(self.bot.get_http_session())
+            while self.running:
+                user_id = await self.changes.get()
+                if user_id is None:
+                    self.schedule_users(self.bot.get_http_session())
+                else:
+                    self.schedule_user(user_id, self.bot.get_http_session())
+        finally:
+            for task in self.user_tasks.values():
+                task.cancel()
+
+    async def restore(self):
+        """Reload cursors and cached live chats of owned users from the checkpoint.
+
+        Resuming from the saved page token and recent ids means a restart,
+        or a takeover of a dead shard's users, neither replays messages
+        already forwarded nor spends a search per channel to find live chats
+        that are still cached. State this process already has is kept.
+        """
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(None, user_store.load_checkpoints)
+        except sqlite3.Error as e:
+            log.warning("Could not load poller checkpoint: %s", e)
+            return
+        now = time.time()
+        channels = self.owned_channels()
+        cursors = lives = 0
+        for key, data in rows.items():
+            kind, _, ident = key.partition(":")
+            if key in self.checkpointed:
                 continue
-            if user["forward_direction"] != "yt_to_twitch":
-                print(f"Skipping user {user_id}: Forward direction is {user['forward_direction']}")
+            state = json.loads(data)
+            if kind == "live" and ident in channels and ident not in live_chat_cache.entries and state["expires_at"] > now:
+                live_chat_cache.entries[ident] = (state["expires_at"], state["live_chat_id"], state["error"])
+                if state["misses"]:
+                    live_chat_cache.misses[ident] = state["misses"]
+                lives += 1
+            elif kind == "cursor" and owns_user(ident) and ident not in self.cursors:
+                self.cursors[ident] = ChatCursor.load(state)
+                cursors += 1
+            else:
                 continue
+            self.checkpointed[key] = data
+        log.info("Restored %d chat cursors and %d live chats from checkpoint", cursors, lives)
+
+    def owned_channels(self):
+        return {user["yt_channel"] for user_id, user in user_state.users.items() if "yt_channel" in user and owns_user(user_id)}
+
+    def snapshot(self):
+        # Only rows for users this process owns, so shards sharing the
+        # database never write or expire each other's checkpoints.
+        rows = {}
+        for user_id, cursor in self.cursors.items():
+            if owns_user(user_id):
+                rows[f"cursor:{user_id}"] = json.dumps(cursor.dump())
+        now = time.time()
+        channels = self.owned_channels()
+        for channel_id, (expires_at, live_chat_id, error) in live_chat_cache.entries.items():
+            if expires_at > now and channel_id in channels:
+                state = {
+                    "expires_at": expires_at, "live_chat_id": live_chat_id, "error": error,
+                    "misses": live_chat_cache.misses.get(channel_id, 0),
+                }
+                rows[f"live:{channel_id}"] = json.dumps(state)
+        return rows
+
+    def save_checkpoint(self, rows):
+        changed = {key: data for key, data in rows.items() if self.checkpointed.get(key) != data}
+        removed = {key: data for key, data in self.checkpointed.items() if key not in rows}
+        if changed or removed:
+            user_store.save_checkpoints(changed, removed)
+        self.checkpointed = rows
+
+    async def checkpoint_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            try:
+                await loop.run_in_executor(None, self.save_checkpoint, self.snapshot())
+            except sqlite3.Error as e:
+                log.warning("Could not save poller checkpoint: %s", e, extra=throttled())
+
+    def is_pollable(self, user_id, user):
+        return (
+            "yt_token" in user and "yt_channel" in user
+            and user.get("forward_direction") == "yt_to_twitch"
+            and user.get("yt_status") != "reauth"
+            and owns_user(user_id)
+        )
 
-            expiry = user.get("yt_token_expiry", 0)
-            if time.time() > expiry - 60:
-                print(f"Refreshing YouTube token for user {user_id}")
-                if not refresh_youtube_token(user_id):
-                    print(f"Failed to refresh YouTube token for user {user_id}, skipping")
-                    continue
+    def schedule_users(self, session):
+        # Full rescan, only needed at startup and when shard ownership moves;
+        # otherwise user changes arrive one at a time through self.changes.
+        for user_id in set(user_state.users) | set(self.user_tasks):
+            self.schedule_user(user_id, session)
+
+    def schedule_user(self, user_id, session):
+        # Every eligible user gets its own long-lived polling task.
+        task = self.user_tasks.get(user_id)
+        if task is not None and task.done():
+            del self.user_tasks[user_id]
+            task = None
+        pollable = self.is_pollable(user_id, get_user(user_id))
+        if pollable and task is None:
+            log.info("Starting YouTube polling", extra={"user_id": user_id})
+            self.user_tasks[user_id] = asyncio.create_task(self.poll_user_loop(user_id, session))
+        elif not pollable and task is not None:
+            log.info("Stopping YouTube polling: missing YouTube token, channel, or forward direction, or owned by another shard", extra={"user_id": user_id})
+            task.cancel()
+            del self.user_tasks[user_id]
+
+    async def poll_user_loop(self, user_id, session):
+        try:
+            while self.running:
                 user = get_user(user_id)
+                if not self.is_pollable(user_id, user):
+                    log.info("Stopping YouTube polling: missing YouTube token, channel, or forward direction, or owned by another shard", extra={"user_id": user_id})
+                    return
+                paused = account_health.retry_in("yt", user_id)
+                if paused:
+                    await self.sleep(user_id, paused)
+                    continue
+                interval, messages = await self.transport.fetch(user_id, session)
+                # Forwarding happens outside the poll semaphore: a full Twitch
+                # send queue should only slow this user down, not hold a poll slot.
+                if messages:
+                    await self.forward_messages(user_id, get_user(user_id), messages)
+                if interval:
+                    await self.sleep(user_id, interval)
+        finally:
+            self.cursors.pop(user_id, None)
+            self.idle_polls.pop(user_id, None)
+            self.transport.close(user_id)
 
-            await self.poll_live_chat(user_id, user, session)
-
-    async def poll_live_chat(self, user_id, user, session):
+    async def sleep(self, user_id, seconds):
+        wakeup = self.wakeups[user_id] = asyncio.Event()
         try:
-            headers = {"Authorization": f"Bearer {user['yt_token']}"}
-
-            url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&channelId={user['yt_channel']}&eventType=live&type=video"
-            async with session.get(url, headers=headers) as resp:
-                if resp.status != 200:
-                    print(f"YT Live search failed for user {user_id}: {await resp.text()}")
-                    return
-                data = await resp.json()
+            await asyncio.wait_for(wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.wakeups.pop(user_id, None)
+
+    def wake(self, user_id):
+        wakeup = self.wakeups.get(user_id)
+        if wakeup is not None:
+            wakeup.set()
+
+    async def prepare(self, user_id, endpoint, session):
+        """Make sure the user has a fresh token and a live chat to read.
+
+        Returns (delay, user, cursor); cursor is None when there is nothing to
+        fetch yet and the caller should wait `delay` seconds.
+        """
+        if not await self.bot.tokens.youtube_token(user_id):
+            log.warning("Failed to refresh YouTube token, skipping poll", extra=throttled(user_id=user_id))
+            return DEFAULT_POLL_INTERVAL, None, None
+        user = get_user(user_id)
+
+        if not quota_budget.can_spend(endpoint):
+            return min(quota_budget.seconds_until_reset(), QUOTA_EXHAUSTED_RECHECK), user, None
+
+        live_chat_id, error = await live_chat_cache.resolve(user_id, user, session)
+        if not live_chat_id:
+            # Nothing to do until the cached "not live" answer expires.
+            return max(live_chat_cache.expires_in(user["yt_channel"]), DEFAULT_POLL_INTERVAL), user, None
+
+        cursor = self.cursors.get(user_id)
+        if cursor is None or cursor.live_chat_id != live_chat_id:
+            cursor = self.cursors[user_id] = ChatCursor(live_chat_id)
+        return 0, user, cursor
+
+    def chat_error(self, user_id, user, cursor, status, text):
+        log.warning("YT Live chat messages failed: %s", text, extra=throttled(user_id=user_id))
+        note_youtube_error(status, text)
+        if is_chat_gone(status, text):
+            live_chat_cache.invalidate(user["yt_channel"])
+            self.cursors.pop(user_id, None)
+        else:
+            note_account_error(user_id, status, text)
+            if status == 400:
+                cursor.page_token = None  # expired or invalid token, restart from the recent backlog
+
+    def accept(self, user_id, cursor, chat_data):
+        """Advance the cursor past a list response and return its unseen messages."""
+        cursor.page_token = chat_data.get("nextPageToken", cursor.page_token)
+        account_health.succeeded("yt", user_id)
+        messages = chat_data.get("items", [])
+        log.debug("Found %d messages", len(messages), extra={"user_id": user_id})
+
+        new_messages = []
+        for message in messages:
+            msg_id = message["id"]
+            if msg_id in cursor.seen:
+                continue
+            cursor.seen.add(msg_id)
+            new_messages.append(message)
+        return new_messages
+
+    def next_interval(self, user_id, base, active):
+        # Busy chats are polled as fast as YouTube allows; each empty poll
+        # stretches the interval, and everything slows down when quota
+        # spending is ahead of the clock.
+        idle = 0 if active else self.idle_polls.get(user_id, 0) + 1
+        self.idle_polls[user_id] = idle
+        interval = max(base, min(base * QUIET_BACKOFF ** idle, QUIET_MAX_INTERVAL))
+        return interval * quota_budget.pace()
+
+    async def forward_messages(self, user_id, user, messages):
+        # A channel that is wanted but not joined yet (JOINs are paced at
+        # startup and after reconnects) still gets its lines queued: the
+        # outbox waits for the JOIN, and a full queue slows this poll down.
+        twitch_username = user.get("twitch_username")
+        if not twitch_username or twitch_username.lower() not in self.bot.joins.wanted:
+            log.warning("Cannot forward YT->Twitch: Twitch channel %s not served", twitch_username, extra=throttled(user_id=user_id))
+            return
 
-            items = data.get("items", [])
-            if not items:
-                print(f"No live stream found for user {user_id}")
+        channel_name = twitch_username.lower()
+        source = f"yt:{user.get('yt_channel')}"
+        for message in messages:
+            text = message["snippet"]["displayMessage"]
+            author = message["authorDetails"]["displayName"]
+            reason = message_filter.check(source, author, text)
+            if reason:
+                log.debug("Suppressed YT %s: %s", reason, text, extra={"user_id": user_id})
+                continue
+            message_filter.forwarded(f"tw:{channel_name}", text)
+            send_text = f"[YT] {author}: {text}"
+            log.debug("Forwarding YT->Twitch: %s", send_text, extra={"user_id": user_id})
+            await self.bot.outbox.send(channel_name, send_text, coalesce=True, published=published_time(message))
+            await self.bot.outbox.send(channel_name, f"!@{twitch_username} response from YouTube {text}")
+
+# === TWITCH OUTBOUND QUEUE ===
+
+class TokenBucket:
+    def __init__(self, limit, window):
+        # Burst of a quarter of the limit plus a steady refill, so that no
+        # window of `window` seconds ever carries more than `limit` messages.
+        # A limit of 1 still refills, one token per window.
+        self.capacity = max(1, limit // 4)
+        self.rate = max(limit - self.capacity, 1) / window
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
                 return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
 
-            live_video_id = items[0]["id"]["videoId"]
-            print(f"Found live stream {live_video_id} for user {user_id}")
+class TwitchOutbox:
+    """Paced per-channel send queues for everything the bot says in Twitch chat.
 
-            details_url = f"https://www.googleapis.com/youtube/v3/videos?part=liveStreamingDetails&id={live_video_id}"
-            async with session.get(details_url, headers=headers) as details_resp:
-                if details_resp.status != 200:
-                    print(f"YT Live details failed for user {user_id}: {await details_resp.text()}")
-                    return
-                details_data = await details_resp.json()
+    Twitch counts messages per bot account, with a higher allowance in
+    channels where the bot is a moderator, so the two buckets are shared by
+    every channel. Senders block once a channel's queue is full instead of
+    having messages dropped by twitchio's own cooldown check; replies sent
+    while handling IRC events use reply(), which never waits.
+    """
 
-            live_chat_id = details_data["items"][0]["liveStreamingDetails"].get("activeLiveChatId")
-            if not live_chat_id:
-                print(f"No active live chat for video {live_video_id} for user {user_id}")
-                return
+    def __init__(self, bot):
+        self.bot = bot
+        self.queues = {}  # channel name -> asyncio.Queue of (text, coalesce, published_at)
+        self.workers = {}  # channel name -> asyncio.Task draining that queue
+        self.buckets = {
+            "irc": TokenBucket(TWITCH_MSG_LIMIT, TWITCH_MSG_WINDOW),
+            "mod": TokenBucket(TWITCH_MOD_MSG_LIMIT, TWITCH_MSG_WINDOW),
+        }
 
-            chat_url = f"https://www.googleapis.com/youtube/v3/liveChat/messages?liveChatId={live_chat_id}&part=snippet,authorDetails"
-            async with session.get(chat_url, headers=headers) as chat_resp:
-                if chat_resp.status != 200:
-                    print(f"YT Live chat messages failed for user {user_id}: {await chat_resp.text()}")
-                    return
+    def queue_for(self, channel_name):
+        queue = self.queues.get(channel_name)
+        if queue is None:
+            queue = self.queues[channel_name] = asyncio.Queue(TWITCH_SEND_QUEUE_SIZE)
+            self.workers[channel_name] = asyncio.create_task(self.run(channel_name, queue))
+        return queue
+
+    async def send(self, channel_name, text, coalesce=False, published=None):
+        await self.queue_for(channel_name).put((text, coalesce, published))
+
+    def reply(self, channel_name, text):
+        try:
+            self.queue_for(channel_name).put_nowait((text, False, None))
+        except asyncio.QueueFull:
+            metrics.inc("twitch_replies_dropped_total")
+            log.warning("Dropping Twitch reply: send queue full", extra=throttled(channel=channel_name))
+
+    def depth(self):
+        return sum(queue.qsize() for queue in list(self.queues.values()))
+
+    def close(self):
+        for task in self.workers.values():
+            task.cancel()
+
+    def bucket_for(self, channel):
+        chatter = channel.get_chatter(self.bot.nick)
+        return self.buckets["mod" if getattr(chatter, "is_mod", False) else "irc"]
+
+    def batch(self, first, queue):
+        # Everything queued behind `first` goes out in one pass: coalescible
+        # lines are merged up to Twitch's length limit, the rest keep their order.
+        # Returns [(text, [publishedAt of each message in it]), ...].
+        items = [first]
+        while not queue.empty():
+            items.append(queue.get_nowait())
+        if not TWITCH_COALESCE or len(items) == 1:
+            return [(text, [published]) for text, _, published in items]
+
+        merged = []
+        others = []
+        for text, coalesce, published in items:
+            if not coalesce:
+                others.append((text, [published]))
+            elif merged and len(merged[-1][0]) + len(TWITCH_COALESCE_SEPARATOR) + len(text) <= TWITCH_MAX_MESSAGE:
+                merged[-1] = (merged[-1][0] + TWITCH_COALESCE_SEPARATOR + text, merged[-1][1] + [published])
+            else:
+                merged.append((text, [published]))
+        return merged + others
+
+    async def run(self, channel_name, queue):
+        while True:
+            first = await queue.get()
+            for text, published in self.batch(first, queue):
+                if not await self.deliver(channel_name, text[:TWITCH_MAX_MESSAGE]):
+                    continue
+                now = time.time()
+                for published_at in published:
+                    if published_at is not None:
+                        metrics.observe("yt_to_twitch_lag_seconds", now - published_at)
+
+    async def deliver(self, channel_name, text):
+        # A line waits out reconnects and unconfirmed JOINs in place, so the
+        # channel's order is kept; it is only given up on once the channel
+        # is no longer wanted or sending keeps failing.
+        failures = 0
+        while channel_name in self.bot.joins.wanted:
+            channel = self.bot.joins.channel(channel_name)
+            if channel is None:
+                await self.bot.joins.wait_joined(channel_name)
+                continue
+            await self.bucket_for(channel).acquire()
+            try:
+                await channel.send(text)
+                return True
+            except Exception as e:
+                failures += 1
+                if failures >= TWITCH_SEND_ATTEMPTS:
+                    log.warning("Dropping Twitch message after %d failed sends: %s", failures, e, extra=throttled(channel=channel_name))
+                    return False
+                log.warning("Failed to send Twitch message, retrying: %s", e, extra=throttled(channel=channel_name))
+                await asyncio.sleep(TWITCH_SEND_RETRY * 2 ** (failures - 1))
+        log.info("Dropping Twitch message: channel is no longer served", extra=throttled(channel=channel_name))
+        return False
+
+# === YOUTUBE OUTBOUND QUEUE ===
+
+class YouTubeOutbox:
+    """Twitch->YouTube forwards, with one paced worker per YouTube channel.
+
+    event_message only enqueues. The worker resolves the live chat, spaces
+    inserts YT_INSERT_INTERVAL apart, retries rate limits, 5xx and network
+    errors with jittered exponential backoff, and reports the outcome to the
+    Twitch channel through the Twitch outbox.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.queues = {}  # yt_channel -> asyncio.Queue of (user_id, twitch channel name, author, text)
+        self.workers = {}  # yt_channel -> asyncio.Task draining that queue
+
+    def send(self, user_id, channel_name, author, text):
+        """Queue a forward; returns False when the channel's queue is full."""
+        yt_channel = get_user(user_id).get("yt_channel")
+        queue = self.queues.get(yt_channel)
+        if queue is None:
+            queue = self.queues[yt_channel] = asyncio.Queue(YT_SEND_QUEUE_SIZE)
+            self.workers[yt_channel] = asyncio.create_task(self.run(queue))
+        try:
+            queue.put_nowait((user_id, channel_name, author, text))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def depth(self):
+        return sum(queue.qsize() for queue in list(self.queues.values()))
+
+    def close(self):
+        for task in self.workers.values():
+            task.cancel()
+
+    async def run(self, queue):
+        while True:
+            user_id, channel_name, author, text = await queue.get()
+            reply = await self.deliver(user_id, author, text)
+            await self.bot.outbox.send(channel_name, f"!@{author} {reply}")
+            await asyncio.sleep(YT_INSERT_INTERVAL)
+
+    async def deliver(self, user_id, author, text):
+        for attempt in range(YT_INSERT_ATTEMPTS):
+            if attempt:
+                delay = min(YT_RETRY_BASE * 2 ** (attempt - 1), YT_RETRY_MAX)
+                await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+            try:
+                result, detail = await self.insert(user_id, author, text)
+            except (ClientError, asyncio.TimeoutError) as e:
+                log.warning("Twitch->YT insert failed (attempt %d/%d): %s", attempt + 1, YT_INSERT_ATTEMPTS, e, extra=throttled(user_id=user_id))
+                continue
+            except Exception as e:
+                log.error("Error forwarding Twitch->YT: %s", e, extra=throttled(user_id=user_id))
+                return "Failed to forward to YouTube: Internal error"
+            if result == "sent":
+                log.debug("Forwarded Twitch->YT: %s", detail, extra={"user_id": user_id})
+                return f"response from YouTube {detail}"
+            if result == "failed":
+                return f"Failed to forward to YouTube: {detail}"
+        return "Failed to forward to YouTube: Could not send message"
+
+    async def insert(self, user_id, author, text):
+        """One attempt: ("sent", displayed text), ("retry", None) or ("failed", reason)."""
+        if not await self.bot.tokens.youtube_token(user_id):
+            log.warning("Failed to refresh YouTube token", extra=throttled(user_id=user_id))
+            return "failed", "Token refresh failed"
+        user = get_user(user_id)
+
+        session = self.bot.get_http_session()
+        live_chat_id, error = await live_chat_cache.resolve(user_id, user, session)
+        if not live_chat_id:
+            return "failed", error
+        if not quota_budget.can_spend("liveChatMessages.insert"):
+            return "failed", "YouTube quota exhausted"
+
+        headers = {"Authorization": f"Bearer {user['yt_token']}"}
+        chat_url = f"{YT_API_BASE}/liveChat/messages?part=snippet"
+        payload = {
+            "snippet": {
+                "liveChatId": live_chat_id,
+                "type": "textMessageEvent",
+                "textMessageDetails": {
+                    "messageText": f"[Twitch] {author}: {text}"
+                }
+            }
+        }
+        quota_budget.record(user_id, "liveChatMessages.insert")
+        started = time.monotonic()
+        async with session.post(chat_url, headers=headers, json=payload) as chat_resp:
+            record_youtube_call("liveChatMessages.insert", chat_resp.status, started)
+            if chat_resp.status == 200:
                 chat_data = await chat_resp.json()
+                return "sent", chat_data["snippet"]["displayMessage"]
+            body = await chat_resp.text()
 
-            messages = chat_data.get("items", [])
-            print(f"Found {len(messages)} messages for user {user_id}")
+        log.warning("Failed to send message to YouTube: %s", body, extra=throttled(user_id=user_id))
+        note_youtube_error(chat_resp.status, body)
+        if chat_resp.status == 429 or chat_resp.status >= 500 or youtube_error_reason(body) == "rateLimitExceeded":
+            return "retry", None
+        if is_chat_gone(chat_resp.status, body):
+            live_chat_cache.invalidate(user["yt_channel"])
+        return "failed", "Could not send message"
 
-            if user_id not in self.last_message_ids:
-                self.last_message_ids[user_id] = set()
+# === TWITCH CHANNEL JOINS ===
 
-            for message in messages:
-                msg_id = message["id"]
-                if msg_id in self.last_message_ids[user_id]:
-                    continue
-                self.last_message_ids[user_id].add(msg_id)
-
-                text = message["snippet"]["displayMessage"]
-                author = message["authorDetails"]["displayName"]
-
-                twitch_username = user.get("twitch_username")
-                if twitch_username and twitch_username.lower() in self.bot.connected_channels:
-                    channel = self.bot.connected_channels[twitch_username.lower()]
-                    send_text = f"[YT] {author}: {text}"
-                    print(f"Forwarding YT->Twitch for user {user_id}: {send_text}")
-                    await channel.send(send_text)
-                    await channel.send(f"!@{twitch_username} response from YouTube {text}")
-                else:
-                    print(f"Cannot forward YT->Twitch for user {user_id}: Twitch channel {twitch_username} not connected")
+class JoinManager:
+    """Keeps the bot in the Twitch channels of the users this process serves.
 
-        except Exception as e:
-            print(f"Error polling YouTube live chat for user {user_id}: {e}")
+    JOINs are paced by a TokenBucket sized to Twitch's JOIN limit, confirmed
+    through event_channel_joined and retried with backoff when Twitch does
+    not confirm them. Channels nobody here serves any more are parted.
+    twitchio only rejoins its initial channels after a reconnect, so the
+    bot calls reset() and every wanted channel is queued again.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.wanted = set()  # channels the bot should be in
+        self.joined = set()  # channels Twitch confirmed the bot is in
+        self.pending = set()  # JOIN sent, waiting for confirmation or failure
+        self.retry_at = {}  # channel -> (failures so far, monotonic time of the next attempt)
+        self.bucket = TokenBucket(TWITCH_JOIN_LIMIT, TWITCH_JOIN_WINDOW)
+        self.wake = asyncio.Event()
+        self.waiters = {}  # channel -> asyncio.Event set once it is joined or no longer wanted
+
+    def sync(self):
+        # Full recompute, for startup and shard ring changes.
+        self.wanted = {
+            channel for channel, (user_id, _, _) in user_state.twitch_index.items() if owns_user(user_id)
+        }
+        self.wake.set()
+
+    def update(self, channel):
+        entry = user_state.twitch_index.get(channel)
+        if entry and owns_user(entry[0]):
+            self.wanted.add(channel)
+        else:
+            self.wanted.discard(channel)
+            self.notify(channel)
+        self.wake.set()
+
+    def reset(self):
+        self.joined.clear()
+        self.pending.clear()
+        self.retry_at.clear()
+        self.wake.set()
+
+    def confirmed(self, channel):
+        self.pending.discard(channel)
+        self.retry_at.pop(channel, None)
+        self.joined.add(channel)
+        self.notify(channel)
+        log.info("Joined Twitch channel", extra={"channel": channel})
+
+    def notify(self, channel):
+        waiter = self.waiters.pop(channel, None)
+        if waiter is not None:
+            waiter.set()
+
+    async def wait_joined(self, channel):
+        # Bounded, so a sender also notices a reconnect or a ring change.
+        waiter = self.waiters.setdefault(channel, asyncio.Event())
+        try:
+            await asyncio.wait_for(waiter.wait(), TWITCH_JOIN_RETRY)
+        except asyncio.TimeoutError:
+            pass
+
+    def failed(self, channel):
+        self.pending.discard(channel)
+        failures = self.retry_at.get(channel, (0, 0))[0] + 1
+        delay = min(TWITCH_JOIN_RETRY * 2 ** (failures - 1), TWITCH_JOIN_RETRY_MAX)
+        self.retry_at[channel] = (failures, time.monotonic() + delay)
+        log.warning("Twitch did not confirm JOIN (attempt %d), retrying in %ds", failures, delay, extra={"channel": channel})
+        self.wake.set()
+
+    def channel(self, name):
+        # twitchio only caches a channel once someone else joins or talks in
+        # it, so a quiet channel we are confirmed in is built by hand.
+        name = name.lower()
+        channel = self.bot.get_channel(name)
+        if channel is None and name in self.joined:
+            channel = Channel(name=name, websocket=self.bot._connection)
+        return channel
+
+    async def run(self):
+        while True:
+            self.wake.clear()
+            stale = self.joined - self.wanted
+            if stale:
+                self.joined -= stale
+                log.info("Parting Twitch channels: %s", sorted(stale))
+                try:
+                    await self.bot.part_channels(list(stale))
+                except Exception as e:
+                    # Disconnected; the new connection is in none of them anyway.
+                    log.warning("Could not part Twitch channels: %s", e)
+
+            now = time.monotonic()
+            due = [
+                channel for channel in self.wanted - self.joined - self.pending
+                if self.retry_at.get(channel, (0, 0))[1] <= now
+            ]
+            for channel in due:
+                await self.bucket.acquire()
+                if channel not in self.wanted or channel in self.joined or channel in self.pending:
+                    continue  # changed while waiting for the bucket
+                self.pending.add(channel)
+                try:
+                    await self.bot.join_channels([channel])
+                except Exception as e:
+                    log.warning("Could not send JOIN: %s", e, extra={"channel": channel})
+                    self.failed(channel)
+
+            waiting = [
+                at for channel, (_, at) in self.retry_at.items()
+                if channel in self.wanted and channel not in self.joined and channel not in self.pending
+            ]
+            timeout = max(min(waiting) - time.monotonic(), 0) if waiting else None
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
 # === TWITCH BOT ===
 
@@ -372,131 +1970,359 @@ class TwitchBot(commands.Bot):
             client_id=TWITCH_CLIENT_ID,
             client_secret=TWITCH_CLIENT_SECRET,
         )
+        self.http_session = None
+        self.tokens = TokenManager(self)
         self.youtube_poller = YouTubeLiveChatPoller(self)
+        self.outbox = TwitchOutbox(self)
+        self.youtube_outbox = YouTubeOutbox(self)
+        self.joins = JoinManager(self)
+        self.background_tasks = []
+        self.live_checks = set()
+        metrics.gauge("twitch_send_queue_depth", self.outbox.depth)
+        metrics.gauge("youtube_send_queue_depth", self.youtube_outbox.depth)
+
+    def get_http_session(self):
+        # One long-lived pool shared by the poller, token refreshes and the
+        # Twitch->YouTube forward path, so requests reuse warm TLS connections.
+        if self.http_session is None or self.http_session.closed:
+            connector = TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                limit_per_host=HTTP_POOL_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE,
+                ttl_dns_cache=HTTP_DNS_TTL,
+            )
+            self.http_session = ClientSession(connector=connector, timeout=ClientTimeout(total=HTTP_TIMEOUT))
+        return self.http_session
+
+    async def close(self):
+        user_state.unsubscribe(self.on_user_change)
+        if self.background_tasks:
+            # Before the poll tasks are cancelled, which drops their cursors.
+            try:
+                self.youtube_poller.save_checkpoint(self.youtube_poller.snapshot())
+            except sqlite3.Error as e:
+                log.warning("Could not save poller checkpoint: %s", e)
+        for task in self.background_tasks:
+            task.cancel()
+        self.outbox.close()
+        self.youtube_outbox.close()
+        if self.http_session:
+            await self.http_session.close()
+        await super().close()
 
     async def event_ready(self):
-        print(f"Bot ready: {self.nick}")
-        print(f"Connected channels: {list(self.connected_channels.keys())}")
-        asyncio.create_task(self.join_linked_channels())
-        asyncio.create_task(self.youtube_poller.start())
-
-    async def join_linked_channels(self):
-        twitch_users = {u["twitch_username"].lower() for u in users.values() if "twitch_username" in u}
-        for channel in twitch_users:
-            print(f"Attempting to join Twitch channel: {channel}")
-            retry_count = 0
-            max_retries = 3
-            while retry_count < max_retries:
-                try:
-                    await self.join_channels([channel])
-                    print(f"Successfully joined Twitch channel: {channel}")
-                    break
-                except Exception as e:
-                    retry_count += 1
-                    print(f"Failed to join channel {channel} (attempt {retry_count}/{max_retries}): {e}")
-                    if retry_count == max_retries:
-                        print(f"Giving up on joining channel {channel}")
-                    await asyncio.sleep(5)
+        log.info("Bot ready: %s", self.nick)
+        log.info("Connected channels: %s", [channel.name for channel in self.connected_channels])
+        if self.background_tasks:
+            # event_ready fires again after every reconnect, on a connection
+            # that is in none of our channels.
+            self.joins.reset()
+            return
+        user_state.subscribe(self.on_user_change)
+        self.joins.sync()
+        self.background_tasks = [
+            asyncio.create_task(self.joins.run()),
+            asyncio.create_task(self.tokens.start()),
+            asyncio.create_task(self.youtube_poller.start()),
+            asyncio.create_task(self.youtube_poller.checkpoint_loop()),
+        ]
+        if shard_inbox is not None:
+            self.background_tasks.append(asyncio.create_task(self.listen_to_coordinator()))
+            self.background_tasks.append(asyncio.create_task(self.push_metrics()))
+
+    async def push_metrics(self):
+        while True:
+            await asyncio.sleep(METRICS_PUSH_INTERVAL)
+            shard_upstream.put(("metrics", SHARD_ID, metrics.snapshot()))
+
+    def on_user_change(self, user_id, old, new):
+        # Runs on whichever thread wrote the change (Flask, or the bot loop).
+        try:
+            self.loop.call_soon_threadsafe(self.apply_user_change, user_id, old, new)
+        except RuntimeError:
+            pass  # loop already closed during shutdown
+
+    def apply_user_change(self, user_id, old, new):
+        self.youtube_poller.changes.put_nowait(user_id)
+        if (old or {}).get("yt_refresh") != new.get("yt_refresh") and account_health.retry_in("yt", user_id):
+            account_health.reset("yt", user_id)  # relinked while paused
+            self.youtube_poller.wake(user_id)
+        old_username = (old or {}).get("twitch_username", "").lower()
+        username = new.get("twitch_username", "").lower()
+        if old_username != username:
+            for channel in filter(None, (old_username, username)):
+                self.joins.update(channel)
+
+    async def listen_to_coordinator(self):
+        global shard_ring
+        loop = asyncio.get_running_loop()
+        while True:
+            kind, *args = await loop.run_in_executor(None, shard_inbox.get)
+            if kind == "user":
+                await loop.run_in_executor(None, reload_user, args[0])
+            elif kind == "ring":
+                shard_ring = HashRing(args[0])
+                log.info("Shard ring is now %s", args[0])
+                await loop.run_in_executor(None, reload_owned_users)
+                await self.youtube_poller.restore()  # pick up where a dead shard left its users
+                self.youtube_poller.changes.put_nowait(None)
+                self.joins.sync()
+            elif kind == "live":
+                self.live_candidates(*args)
+            elif kind == "lease":
+                channel_id, ends_at = args
+                live_chat_cache.leases[channel_id] = ends_at
+
+    def live_candidates(self, user_id, channel_id, video_ids):
+        task = asyncio.create_task(self.confirm_live(user_id, channel_id, video_ids))
+        self.live_checks.add(task)
+        task.add_done_callback(self.live_checks.discard)
+
+    async def confirm_live(self, user_id, channel_id, video_ids):
+        if not await self.tokens.youtube_token(user_id):
+            return
+        user = get_user(user_id)
+        if user.get("yt_channel") != channel_id:
+            return
+        try:
+            live_chat_id, _ = await live_chat_cache.confirm(user_id, user, video_ids, self.get_http_session())
+        except Exception as e:
+            log.warning("Could not check WebSub push: %s", e, extra={"user_id": user_id})
+            return
+        if live_chat_id:
+            self.youtube_poller.wake(user_id)
+
+    async def event_channel_joined(self, channel):
+        self.joins.confirmed(channel.name)
+
+    async def event_channel_join_failure(self, channel):
+        self.joins.failed(channel)
+
+    async def event_command_error(self, context, error):
+        # The bot has no commands of its own; every "!..." chat line lands
+        # here, and twitchio's default prints a traceback for each one.
+        if isinstance(error, commands.CommandNotFound):
+            return
+        log.error("Twitch command error: %s", error, exc_info=error)
 
     async def event_message(self, message):
+        started = time.monotonic()
+        try:
+            await self.handle_message(message)
+        finally:
+            metrics.observe("twitch_event_message_seconds", time.monotonic() - started)
+
+    async def handle_message(self, message):
         if message.echo:
             return
 
         await self.handle_commands(message)
 
         user = message.author.name.lower()
-        matched_user_id = None
-        matched_user = None
-        for uid, u in users.items():
-            if u.get("twitch_username", "").lower() == user:
-                matched_user_id = uid
-                matched_user = u
-                break
-
-        if matched_user:
-            cmd = matched_user.get("forward_command")
-            direction = matched_user.get("forward_direction")
-            print(f"Processing message from {user}: command={cmd}, direction={direction}")
+        entry = user_state.twitch_index.get(user)
+        if entry and owns_user(entry[0]):
+            matched_user_id, cmd, direction = entry
             if cmd and message.content.startswith(cmd):
+                log.debug("Processing message from %s: command=%s, direction=%s", user, cmd, direction, extra={"user_id": matched_user_id})
                 payload = message.content[len(cmd):].strip()
                 if direction == "twitch_to_yt":
-                    print(f"Processing Twitch->YT for user {matched_user_id}: {payload}")
-                    await message.channel.send(f"!@{user} the message will be sent to YouTube")
-                    expiry = matched_user.get("yt_token_expiry", 0)
-                    if time.time() > expiry - 60:
-                        print(f"Refreshing YouTube token for user {matched_user_id}")
-                        if not refresh_youtube_token(matched_user_id):
-                            print(f"Failed to refresh YouTube token for user {matched_user_id}")
-                            await message.channel.send(f"!@{user} Failed to forward to YouTube: Token refresh failed")
-                            return
-                        matched_user = get_user(matched_user_id)
-
-                    async with ClientSession() as session:
-                        try:
-                            headers = {"Authorization": f"Bearer {matched_user['yt_token']}"}
-                            url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&channelId={matched_user['yt_channel']}&eventType=live&type=video"
-                            async with session.get(url, headers=headers) as resp:
-                                if resp.status != 200:
-                                    print(f"YT Live search failed for user {matched_user_id}: {await resp.text()}")
-                                    await message.channel.send(f"!@{user} Failed to forward to YouTube: No live stream found")
-                                    return
-                                data = await resp.json()
-
-                            items = data.get("items", [])
-                            if not items:
-                                print(f"No live stream found for user {matched_user_id}")
-                                await message.channel.send(f"!@{user} Failed to forward to YouTube: No live stream found")
-                                return
-
-                            live_video_id = items[0]["id"]["videoId"]
-                            details_url = f"https://www.googleapis.com/youtube/v3/videos?part=liveStreamingDetails&id={live_video_id}"
-                            async with session.get(details_url, headers=headers) as details_resp:
-                                if details_resp.status != 200:
-                                    print(f"YT Live details failed for user {matched_user_id}: {await details_resp.text()}")
-                                    await message.channel.send(f"!@{user} Failed to forward to YouTube: Could not get live stream details")
-                                    return
-                                details_data = await details_resp.json()
-
-                            live_chat_id = details_data["items"][0]["liveStreamingDetails"].get("activeLiveChatId")
-                            if not live_chat_id:
-                                print(f"No active live chat for video {live_video_id} for user {matched_user_id}")
-                                await message.channel.send(f"!@{user} Failed to forward to YouTube: No active live chat")
-                                return
-
-                            chat_url = f"https://www.googleapis.com/youtube/v3/liveChat/messages?part=snippet"
-                            payload = {
-                                "snippet": {
-                                    "liveChatId": live_chat_id,
-                                    "type": "textMessageEvent",
-                                    "textMessageDetails": {
-                                        "messageText": f"[Twitch] {user}: {payload}"
-                                    }
-                                }
-                            }
-                            async with session.post(chat_url, headers=headers, json=payload) as chat_resp:
-                                if chat_resp.status != 200:
-                                    print(f"Failed to send message to YouTube for user {matched_user_id}: {await chat_resp.text()}")
-                                    await message.channel.send(f"!@{user} Failed to forward to YouTube: Could not send message")
-                                    return
-                                chat_data = await chat_resp.json()
-                                sent_message = chat_data["snippet"]["displayMessage"]
-                                print(f"Forwarded Twitch->YT for user {matched_user_id}: {sent_message}")
-                                await message.channel.send(f"!@{user} response from YouTube {sent_message}")
-
-                        except Exception as e:
-                            print(f"Error forwarding Twitch->YT for user {matched_user_id}: {e}")
-                            await message.channel.send(f"!@{user} Failed to forward to YouTube: Internal error")
-                        finally:
-                            await session.close()
+                    log.debug("Processing Twitch->YT: %s", payload, extra={"user_id": matched_user_id})
+                    reason = message_filter.check(f"tw:{message.channel.name}", user, payload)
+                    if reason:
+                        log.debug("Suppressed Twitch %s: %s", reason, payload, extra={"user_id": matched_user_id})
+                        if reason == "duplicate":
+                            self.outbox.reply(message.channel.name, f"!@{user} Not sent to YouTube: you just sent the same message")
+                        else:
+                            self.outbox.reply(message.channel.name, f"!@{user} Not sent to YouTube: that text just came from YouTube")
+                        return
+                    message_filter.forwarded(f"yt:{get_user(matched_user_id).get('yt_channel')}", payload)
+                    self.outbox.reply(message.channel.name, f"!@{user} the message will be sent to YouTube")
+                    if not self.youtube_outbox.send(matched_user_id, message.channel.name, user, payload):
+                        self.outbox.reply(message.channel.name, f"!@{user} Failed to forward to YouTube: Too many messages queued")
                 else:
-                    print(f"Twitch message from {user} not forwarded: Direction is {direction}")
+                    log.debug("Twitch message from %s not forwarded: direction is %s", user, direction, extra={"user_id": matched_user_id})
+
+# === SHARDING ===
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hash ring: removing a shard only moves that shard's users."""
+
+    def __init__(self, shard_ids, vnodes=SHARD_VNODES):
+        self.members = sorted(shard_ids)
+        points = sorted((ring_hash(f"{shard_id}:{i}"), shard_id) for shard_id in self.members for i in range(vnodes))
+        self.hashes = [h for h, _ in points]
+        self.owners = [shard_id for _, shard_id in points]
+
+    def owner(self, user_id):
+        if not self.hashes:
+            return None
+        return self.owners[bisect.bisect(self.hashes, ring_hash(user_id)) % len(self.hashes)]
+
+# Set in shard worker processes by run_shard; None when running unsharded.
+SHARD_ID = None
+shard_ring = None
+shard_inbox = None  # coordinator -> this shard: ("user", user_id, user), ("ring", members), ("live", user_id, yt_channel, video_ids)
+shard_upstream = None  # this shard -> coordinator: ("user", user_id, user)
+
+# Set in the coordinator process when SHARDS > 1.
+shard_coordinator = None
+
+# Set by run_bot to the TwitchBot running in this process.
+local_bot = None
+
+def owns_user(user_id):
+    return shard_ring is None or shard_ring.owner(user_id) == SHARD_ID
+
+def reload_user(user_id):
+    # The coordinator's snapshot can be older than a change this shard made
+    # since (a refreshed token, a rotated Twitch refresh token), so the
+    # store's row is applied rather than the snapshot.
+    with user_state.lock:
+        user = user_store.load(user_id)
+        if user is not None and user != user_state.get(user_id):
+            user_state.put(user_id, user)
+
+def reload_owned_users():
+    # Changes are only routed to a user's owner, so users taken over from
+    # another shard are stale here (and ones linked since startup missing);
+    # the store has their current records.
+    with user_state.lock:
+        for user_id, user in user_store.load_all().items():
+            if owns_user(user_id) and user != user_state.get(user_id):
+                user_state.put(user_id, user)
+
+def publish_user(user_id, user):
+    if shard_coordinator is not None:
+        shard_coordinator.route(user_id, user)
+    elif shard_upstream is not None:
+        shard_upstream.put(("user", user_id, user))
+
+class ShardCoordinator:
+    """Runs TwitchBot shards in worker processes and keeps them in sync with the Flask side.
+
+    Each shard has its own Twitch IRC connection and poller and only serves
+    the users the ring assigns to it. User changes made through Flask go to
+    the owning shard; changes made inside a shard (token refreshes) come back
+    here so the coordinator's copy stays current. Both sides re-read the
+    record from the shared store on a change notice, so an older snapshot
+    never overwrites a newer record. A shard that dies is taken
+    off the ring, so the others pick up its users, and is restarted later.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.mp = multiprocessing.get_context("spawn")
+        self.ring = HashRing(range(count))
+        self.upstream = self.mp.Queue()
+        self.inboxes = {}  # shard_id -> multiprocessing.Queue
+        self.processes = {}  # shard_id -> multiprocessing.Process
+        self.dead_since = {}  # shard_id -> time the shard was found dead
+        self.shard_metrics = {}  # shard_id -> latest metrics snapshot pushed by that shard
+        self.stopping = False
+
+    def start(self):
+        for shard_id in range(self.count):
+            self.spawn(shard_id)
+        threading.Thread(target=self.monitor, daemon=True).start()
+        threading.Thread(target=self.receive_updates, daemon=True).start()
+
+    def spawn(self, shard_id):
+        inbox = self.inboxes[shard_id] = self.mp.Queue()
+        process = self.mp.Process(
+            target=run_shard,
+            args=(shard_id, self.count, self.ring.members, inbox, self.upstream),
+            name=f"shard-{shard_id}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard_id] = process
+        for channel_id, ends_at in list(websub.leases.items()):
+            inbox.put(("lease", channel_id, ends_at))
+        log.info("Started shard %s (pid %s)", shard_id, process.pid)
+
+    def route(self, user_id, user):
+        self.send(user_id, ("user", user_id, user))
+
+    def send(self, user_id, message):
+        shard_id = self.ring.owner(user_id)
+        if shard_id is not None:
+            self.inboxes[shard_id].put(message)
+
+    def broadcast(self, message):
+        for shard_id in self.ring.members:
+            self.inboxes[shard_id].put(message)
+
+    def set_ring(self, members):
+        self.ring = HashRing(members)
+        log.info("Shard ring is now %s", self.ring.members)
+        for shard_id in self.ring.members:
+            self.inboxes[shard_id].put(("ring", self.ring.members))
+
+    def stop(self):
+        # Shards close cleanly on SIGTERM, writing their final checkpoint.
+        self.stopping = True
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + SHARD_STOP_TIMEOUT
+        for shard_id, process in self.processes.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                log.warning("Shard %s did not stop in time, killing it", shard_id)
+                process.kill()
+
+    def monitor(self):
+        while not self.stopping:
+            time.sleep(SHARD_MONITOR_INTERVAL)
+            if self.stopping:
+                return
+            for shard_id, process in list(self.processes.items()):
+                if shard_id in self.dead_since or process.is_alive():
+                    continue
+                log.warning("Shard %s exited with code %s, reassigning its users", shard_id, process.exitcode)
+                self.dead_since[shard_id] = time.time()
+                self.set_ring([s for s in self.ring.members if s != shard_id])
+            for shard_id, since in list(self.dead_since.items()):
+                if time.time() - since < SHARD_RESPAWN_DELAY:
+                    continue
+                del self.dead_since[shard_id]
+                self.ring = HashRing(self.ring.members + [shard_id])
+                self.spawn(shard_id)
+                self.set_ring(self.ring.members)
+
+    def receive_updates(self):
+        while True:
+            kind, *args = self.upstream.get()
+            if kind == "user":
+                reload_user(args[0])
+            elif kind == "metrics":
+                shard_id, snapshot = args
+                self.shard_metrics[shard_id] = snapshot
+
+    def metrics_snapshots(self):
+        return [((("shard", shard_id),), snapshot) for shard_id, snapshot in sorted(self.shard_metrics.items())]
+
+def run_shard(shard_id, count, members, inbox, upstream):
+    global SHARD_ID, shard_ring, shard_inbox, shard_upstream
+    SHARD_ID = shard_id
+    shard_ring = HashRing(members)
+    shard_inbox = inbox
+    shard_upstream = upstream
+    quota_budget.daily_budget = YT_DAILY_QUOTA // count  # shards split the project's daily quota
+    log.info("Shard owns %d users", sum(1 for uid in user_state.users if owns_user(uid)))
+    run_bot()
 
 # === RUN SERVER + BOT ===
 
 def run_flask():
+    if PUBLIC_URL:
+        websub.start()
     app.run(host="0.0.0.0", port=10000)
 
-def run_bot():
+def check_env():
     missing_vars = []
     env_vars = {
         "TWITCH_CLIENT_ID": TWITCH_CLIENT_ID,
@@ -509,22 +2335,52 @@ def run_bot():
         if not var_value:
             missing_vars.append(var_name)
     if missing_vars:
-        print(f"Missing required environment variables: {', '.join(missing_vars)}")
-        return
+        log.error("Missing required environment variables: %s", ", ".join(missing_vars))
+        return False
     if not TWITCH_BOT_TOKEN.startswith("oauth:"):
-        print("Invalid TWITCH_BOT_TOKEN: Must start with 'oauth:'")
+        log.error("Invalid TWITCH_BOT_TOKEN: must start with 'oauth:'")
+        return False
+    return True
+
+def run_bot():
+    global local_bot
+    if not check_env():
         return
     try:
-        bot = TwitchBot()
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        bot = local_bot = TwitchBot()  # twitchio binds to the current loop at construction
+        try:
+            # Platforms stop the service with SIGTERM; close cleanly so the
+            # final poller checkpoint gets written.
+            loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(bot.close()))
+        except (NotImplementedError, RuntimeError):
+            pass  # not on the main thread, or no signal support on this platform
         try:
             loop.run_until_complete(bot.start())
         finally:
             loop.close()
     except Exception as e:
-        print(f"Bot failed to start: {e}")
+        log.exception("Bot failed to start: %s", e)
+
+def run_sharded():
+    global shard_coordinator
+    if not check_env():
+        return
+    shard_coordinator = ShardCoordinator(SHARDS)
+    shard_coordinator.start()
+
+    def stop(signum, frame):
+        log.info("Stopping shards")
+        shard_coordinator.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    run_flask()
 
 if __name__ == "__main__":
-    threading.Thread(target=run_flask, daemon=True).start()
-    run_bot()
+    if SHARDS > 1:
+        run_sharded()
+    else:
+        threading.Thread(target=run_flask, daemon=True).start()
+        run_bot()